@@ -0,0 +1,318 @@
+"""
+JSON over HTTP API for driving hoards without the Streamlit UI, built on
+asyncio from the standard library only.
+
+    python api.py --port 8765
+
+Hoards are kept in a CampaignStore (see campaigns.py), one per campaign id.
+Don't point this server and the Streamlit app at the same campaign
+directory at the same time, each process would overwrite the other's saves.
+
+    GET  /campaigns/<id>                    summary of every army
+    GET  /campaigns/<id>/<army>             one army's full roster
+    POST /campaigns/<id>/raise              {"undead_type", "count", "seed"}
+    POST /campaigns/<id>/<army>/<action>    action is one of ACTIONS
+    POST /campaigns/<id>/batch              {"actions": [{"action", "army", ...}, ...]}
+
+With --combat-log PATH every attack and saving throw is also appended to
+a rotating JSONL combat log (see combatlog.py).
+
+<army> is the undead type the army was raised as, e.g. Skeleton. Each
+action runs in a worker thread while holding its army's lock, so requests
+for different armies run side by side and requests for the same army take
+turns. A batch takes the locks of every army it touches up front and runs
+its actions in order, reporting an error for any action that fails without
+stopping the rest. The hoard is only looked up once the locks are held,
+and its campaign is pinned in the store until the action is done, so it
+can't be evicted (and the action's changes lost) in the meantime.
+
+Only raise and batch create a campaign; anything else on a campaign that
+doesn't exist is a 404.
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+from urllib.parse import unquote, urlsplit
+import numpy as np
+from campaigns import check_campaign_id, get_campaign_store
+from classes import SkeletonArmy
+from combatlog import CombatLog, get_log_writer
+
+MAX_BODY = 16 * 1024 * 1024
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Can't send {type(value).__name__} as JSON")
+
+def result_to_dict(result):
+    # AttackResult and SavingThrowResult, with their summary properties
+    data = dataclasses.asdict(result)
+    data['total_damage'] = result.total_damage
+    return data
+
+def army_summary(army):
+    return {
+        'undead_type': army.undead_type,
+        'count': len(army),
+        'max_health': int(army.max_health),
+        'total_health': int(army._columns['current_health'][army._alive_rows()].sum()),
+        'round': army.effects.round,
+    }
+
+def _ids(params):
+    ids = params.get('ids')
+    if ids == 'all' or ids is None:
+        return None
+    if not isinstance(ids, list):
+        raise ApiError(400, "ids must be a list of skeleton IDs or 'all'.")
+    return [int(i) for i in ids]
+
+def _selected(army, params):
+    ids = _ids(params)
+    return army.ids().tolist() if ids is None else ids
+
+def _add(army, params):
+    army.add_skeletons(int(params['count']))
+    return army_summary(army)
+
+def _attack(army, params):
+    return result_to_dict(army.group_attack(_selected(army, params), int(params['armor_class']),
+                                            params.get('attack_type', army.profile.attack_types[0])))
+
+def _saving_throw(army, params):
+    return result_to_dict(army.group_saving_throw(_selected(army, params), int(params['dc']),
+                                                  int(params['damage']), params.get('ability', 'dexterity')))
+
+def _buff(army, params):
+    army.add_damage_buff(int(params['buff']), int(params['duration']), params.get('name', 'buff'),
+                         params.get('stacking', 'stack'), _ids(params))
+    return army_summary(army)
+
+def _advance_round(army, params):
+    expired = army.advance_round(int(params.get('rounds', 1)))
+    return {**army_summary(army), 'expired': expired}
+
+def _reset_buff(army, params):
+    army.reset_buff()
+    return army_summary(army)
+
+def _health(army, params):
+    # {"updates": {"<id>": damage}}, negative damage heals
+    army.update_health({int(skel_id): int(damage) for skel_id, damage in params['updates'].items()})
+    return army_summary(army)
+
+def _damage(army, params):
+    # {"ids": [...], "amounts": [...] or one amount, "modifiers": [...] or one,
+    #  "damage_type": "fire"}, negative amounts heal
+    ids = params['ids']
+    if not isinstance(ids, list):
+        raise ApiError(400, "ids must be a list of skeleton IDs.")
+    collapsed = army.apply_health(ids, params['amounts'], params.get('modifiers'), params.get('damage_type'))
+    return {**army_summary(army), 'collapsed': collapsed}
+
+def _snapshot(army, params):
+    return {**army_summary(army), 'skeletons': army.to_dataframe().to_dict(orient='list')}
+
+ACTIONS = {
+    'add': _add,
+    'attack': _attack,
+    'saving_throw': _saving_throw,
+    'buff': _buff,
+    'reset_buff': _reset_buff,
+    'advance_round': _advance_round,
+    'health': _health,
+    'damage': _damage,
+    'snapshot': _snapshot,
+}
+
+def _raise(hoard, params):
+    undead_type = params['undead_type']
+    if undead_type in hoard:
+        raise ApiError(400, f"{undead_type} hoard already exists.")
+    army = SkeletonArmy.from_undead_type(undead_type, seed=params.get('seed'))
+    army.add_skeletons(int(params.get('count', 0)))
+    hoard[undead_type] = army
+    return army_summary(army)
+
+class HoardServer:
+    def __init__(self, store=None, combat_log=None):
+        self.store = store or get_campaign_store()
+        self.combat_log = combat_log
+        self._locks = {}
+
+    def _lock(self, campaign_id, army_name):
+        key = (campaign_id, army_name)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def _run(self, hoard, request):
+        # One action of a request or batch, run in a worker thread
+        action = request.get('action')
+        try:
+            if action == 'raise':
+                return _raise(hoard, request)
+            if action not in ACTIONS:
+                raise ApiError(404, f"Unknown action: {action}")
+            army = hoard.get(request.get('army'))
+            if army is None:
+                raise ApiError(404, f"No {request.get('army')} hoard in this campaign.")
+            if army.combat_log is None:
+                army.combat_log = self.combat_log
+            return ACTIONS[action](army, request)
+        except KeyError as e:
+            raise ApiError(400, f"Missing parameter {e}") from None
+        except (TypeError, ValueError) as e:
+            raise ApiError(400, str(e)) from None
+
+    def _hoard(self, campaign_id, create):
+        try:
+            return self.store.get(campaign_id, create)
+        except KeyError:
+            raise ApiError(404, f"No campaign {campaign_id}.") from None
+
+    def _army_names(self, campaign_id):
+        with self.store.pin(campaign_id):
+            return list(self._hoard(campaign_id, False))
+
+    def _with_hoard(self, campaign_id, create, func, *args):
+        with self.store.pin(campaign_id):
+            return func(self._hoard(campaign_id, create), *args)
+
+    async def _locked(self, campaign_id, army_names, create, func, *args):
+        # Locks are always taken in name order so two batches can't deadlock
+        locks = [self._lock(campaign_id, name) for name in sorted(set(army_names))]
+        for lock in locks:
+            await lock.acquire()
+        try:
+            return await asyncio.to_thread(self._with_hoard, campaign_id, create, func, *args)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def _batch(self, hoard, actions):
+        results = []
+        for request in actions:
+            try:
+                results.append({'ok': True, 'result': self._run(hoard, request)})
+            except ApiError as e:
+                results.append({'ok': False, 'error': str(e)})
+        return {'results': results}
+
+    async def handle(self, method, path, body):
+        parts = [unquote(p) for p in urlsplit(path).path.split('/') if p]
+        if len(parts) < 2 or parts[0] != 'campaigns':
+            raise ApiError(404, f"No route for {path}")
+        try:
+            campaign_id = check_campaign_id(parts[1])
+        except ValueError as e:
+            raise ApiError(400, str(e)) from None
+        rest = parts[2:]
+
+        if method == 'GET':
+            if not rest:
+                names = await asyncio.to_thread(self._army_names, campaign_id)
+                summarize = lambda hoard: {name: army_summary(army) for name, army in list(hoard.items())}
+                return await self._locked(campaign_id, names, False, summarize)
+            if len(rest) == 1:
+                return await self._locked(campaign_id, rest, False, self._run, {'action': 'snapshot', 'army': rest[0]})
+            raise ApiError(404, f"No route for {path}")
+        if method != 'POST':
+            raise ApiError(405, f"{method} is not supported")
+
+        if body is not None and not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object.")
+        params = body or {}
+        if rest == ['batch']:
+            actions = params.get('actions')
+            if not isinstance(actions, list) or not all(isinstance(a, dict) for a in actions):
+                raise ApiError(400, "A batch needs a list of actions.")
+            names = [a.get('undead_type') if a.get('action') == 'raise' else a.get('army') for a in actions]
+            return await self._locked(campaign_id, [str(n) for n in names], True, self._batch, actions)
+        if rest == ['raise']:
+            request = {**params, 'action': 'raise'}
+            return await self._locked(campaign_id, [str(params.get('undead_type'))], True, self._run, request)
+        if len(rest) == 2:
+            request = {**params, 'action': rest[1], 'army': rest[0]}
+            return await self._locked(campaign_id, [rest[0]], False, self._run, request)
+        raise ApiError(404, f"No route for {path}")
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                length = int(headers.get('content-length', 0))
+                try:
+                    if length > MAX_BODY:
+                        raise ApiError(413, "Request body is too large.")
+                    raw = await reader.readexactly(length) if length else b''
+                    try:
+                        body = json.loads(raw) if raw else None
+                    except ValueError:
+                        raise ApiError(400, "Request body is not valid JSON.") from None
+                    status, payload = 200, await self.handle(method, path, body)
+                except ApiError as e:
+                    status, payload = e.status, {'error': str(e)}
+                    keep_alive = keep_alive and e.status != 413
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+
+                data = json.dumps(payload, default=_jsonable).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(host='127.0.0.1', port=8765, store=None, combat_log=None):
+    server = HoardServer(store, combat_log)
+    tcp = await asyncio.start_server(server.serve_client, host, port)
+    async with tcp:
+        await tcp.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--combat-log', help="JSONL file to log every roll to")
+    args = parser.parse_args()
+    combat_log = CombatLog(get_log_writer(args.combat_log)) if args.combat_log else None
+    try:
+        asyncio.run(serve(args.host, args.port, combat_log=combat_log))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,31 @@
 import random
+import numpy as np
+import altair as alt
 import streamlit as st
 import pandas as pd
-import math
-import pickle
 import io
+import math
+import os
+import time
+from contextlib import nullcontext
+from fractions import Fraction
 from classes import Skeleton, SkeletonArmy
+from utils import parse_amounts, parse_skeleton_ids
+from simulator import army_damage_buffs
+from encounter import Monster, army_horde, simulate_encounters
+from sweep import ARMY_SIZES, DAMAGE_BUFFS, sweep
+from distribution import exact_attack_odds
+from odds import get_odds_table
+from assets import load_skeleton_sprites, load_title_image
+from savefile import FILE_EXTENSION, SaveFormatError, load_hoard, save_hoard_bytes
+from journal import Journal
+from combatlog import CombatLog
+from stats import chi_square_fairness
+from undead import BUILTIN_TYPES, DAMAGE_MODIFIERS, DAMAGE_TYPES, UNDEAD_TYPES
+from bestiary import BestiaryError, get_bestiary
+from campaigns import check_campaign_id, get_campaign_store
+import instrumentation
+from instrumentation import observe, span
 
 
 #CLI
@@ -13,64 +34,76 @@ def set_starting_skeleton_id():
     starting_id = int(input("Enter the starting ID for skeletons: "))
     Skeleton.set_starting_id(starting_id)
 
-def parse_skeleton_ids(input_str):
-    """
-    Parses a string input to extract skeleton IDs.
-    Supports ranges indicated by a hyphen and lists separated by commas.
-    """
-    skeleton_ids = []
-    parts = input_str.split(',')
-    for part in parts:
-        if '-' in part:
-            start, end = map(int, part.split('-'))
-            skeleton_ids.extend(range(start, end + 1))
-        else:
-            skeleton_ids.append(int(part))
-    return skeleton_ids
-
-
 def update_skeleton_health(army):
     army.display_army_health()
     input_str = input("Enter skeleton IDs to apply damage (e.g., '10-14, 16' or '10, 11, 13'): ")
-    damage = int(input("Enter the damage each skeleton takes (use a negative number to heal): "))
+    damage = input("Enter the damage each skeleton takes, or one amount per ID (use a negative number to heal): ")
 
     skeleton_ids = parse_skeleton_ids(input_str)
-    updates = {skeleton_id: damage for skeleton_id in skeleton_ids}
+    amounts = parse_amounts(damage)
     
-    army.update_health(updates)
+    for skel_id in army.apply_health(skeleton_ids, amounts if len(amounts) > 1 else amounts[0]):
+        print(f"Skeleton {skel_id} has collapsed.")
+    army.display_army_health()
 
-def create_and_add_skeletons():
-    skeleton_army = SkeletonArmy(health=47, attack_bonus=13, dex_bonus=2)
+def create_and_add_skeletons(undead_type='Skeleton'):
+    skeleton_army = SkeletonArmy.from_undead_type(undead_type)
+    skeleton_army.journal = Journal(skeleton_army)
     num_skeletons = add_skeletons_cli(skeleton_army)
     return skeleton_army,num_skeletons
 
 def add_skeletons_cli(army):
-    number_to_add = st.text_input('How many skeletons would you like to add? ')
+    number_to_add = st.text_input(f'How many {army.undead_type}s would you like to add? ')
     if number_to_add != '':
-        army.add_skeletons(int(number_to_add))
+        try:
+            army.add_skeletons(int(number_to_add))
+        except ValueError as e:
+            st.write(str(e))
+            return ''
 
     return number_to_add
     
-def raise_hoard(undead_hoard):
-    undead_option = st.selectbox('Which undead would you like to raise?', ['None','Skeleton'])
+def bestiary_options(bestiary):
+    # Narrow long bestiaries down by challenge rating; only the index is read
+    ratings = bestiary.challenge_ratings()
+    if len(ratings) < 2:
+        return bestiary.names()
+    low, high = st.select_slider('Challenge rating', options=ratings, value=(ratings[0], ratings[-1]),
+                                 format_func=lambda cr: str(Fraction(cr)))
+    return sorted(bestiary.names_by_rating(low, high), key=str.lower)
 
-    if undead_option == 'Skeleton':
+def raise_hoard(undead_hoard):
+    bestiary = get_bestiary()
+    options = list(UNDEAD_TYPES)
+    if len(bestiary):
+        options += [name for name in bestiary_options(bestiary) if name not in UNDEAD_TYPES]
+    undead_option = st.selectbox('Which undead would you like to raise?', ['None'] + options)
+
+    if undead_option != 'None':
+        # Bestiary entries are only parsed once somebody raises them, and
+        # never stand in for a built-in type of the same name
+        if undead_option in bestiary and undead_option not in BUILTIN_TYPES:
+            try:
+                bestiary.register(undead_option)
+            except BestiaryError as e:
+                st.write(f"Could not read {undead_option} from the bestiary: {e}")
+                return
         if undead_option not in undead_hoard:
-            army,num_skeletons = create_and_add_skeletons()
+            army,num_skeletons = create_and_add_skeletons(undead_option)
             if num_skeletons != '':
                 st.write("Raised " + num_skeletons + " " + undead_option + "s to the hoard")
                 undead_hoard[undead_option] = army
         else: 
-            st.write('Skeleton Hoard Already Exists')
+            st.write(undead_option + ' Hoard Already Exists')
         # else: 
         #     new_skeleton_hoard = st.selectbox("Skeleton hoard already exists, would you like to delete the old group and make a new one?",['Yes','No'])
         #     if new_skeleton_hoard == 'Yes':
         #         army,num_skeletons = create_and_add_skeletons()
 
 def add_undead(undead_hoard):
-    undead_option = st.selectbox('Which undead would you like to raise?', ['None','Skeleton'])
-    if undead_option == 'Skeleton':
-        army = undead_hoard['Skeleton']
+    undead_option = st.selectbox('Which undead would you like to raise?', ['None'] + list(undead_hoard))
+    if undead_option != 'None':
+        army = undead_hoard[undead_option]
         num_skeletons = add_skeletons_cli(army)
         if num_skeletons != '':
             st.write("Added " + num_skeletons + " " + undead_option + "s to the hoard")
@@ -81,33 +114,37 @@ def remove_skeletons_cli(army):
     input_str = input("Enter the IDs of skeletons to remove (e.g., '1-5', '1,6,9'): ")
     skeleton_ids = parse_skeleton_ids(input_str)
     army.remove_skeletons(skeleton_ids)
+    army.display_army_health()
+
+# Healthy, damaged and nearly defeated, in the same order as the images list
+HEALTH_ICONS = ('🟢', '🟡', '🔴')
+PAGE_SIZES = [12, 24, 48, 96]
+
+def health_bucket(current_health, max_health):
+    # Works on single values or whole columns
+    current_health = np.asarray(current_health)
+    max_health = np.asarray(max_health)
+    return np.select([current_health < max_health*0.25, current_health < max_health*0.75], [2, 1], 0)
+
+def format_rate(rate):
+    return 'NA' if rate is None else f'{round(rate * 100, 2)}%'
+
+def success_rate(skeleton):
+    total_attempts = skeleton.num_successes + skeleton.num_fails
+    return format_rate(skeleton.num_successes / total_attempts if total_attempts else None)
 
 def display_skeleton_image(skeleton,images):
     current_health = skeleton.current_health
     max_health = skeleton.max_health
+    image = images[health_bucket(current_health, max_health)]
 
-    if current_health < (max_health*0.25):
-        image_path = images[-1]
-
-    elif current_health < (max_health*0.75):
-        image_path = images[-2]  
-    
-    else: 
-        image_path = images[-3]
-
-    skeleton_label = 'Skeleton: ' + str(skeleton.id)
+    skeleton_label = skeleton.undead_type + ': ' + str(skeleton.id)
     skeleton_health = f'{str(current_health)}/{str(max_health)}'
 
     st.markdown(f'<u class="skeleton">{skeleton_label}</u> &nbsp;&nbsp;&nbsp;&nbsp;<span class="normal">{skeleton_health}</span>', unsafe_allow_html=True)   
-    st.image(image_path, width=None)
+    st.image(image)
 
-    total_attempts = skeleton.num_successes + skeleton.num_fails
-    if(total_attempts==0):
-        hit_rate = 'NA'
-    else:
-        hit_rate = skeleton.num_successes / total_attempts
-        hit_rate = str(round(hit_rate * 100,2))+'%'
-    
+    hit_rate = success_rate(skeleton)
 
     # if(skeleton.last_roll < 10):
     #     first_row_spaces = "  "
@@ -116,13 +153,306 @@ def display_skeleton_image(skeleton,images):
     st.write(f'Damage Done: {str(skeleton.damage_done)} | Success Rate: {hit_rate}')
 
 
-def display_skeleton_stats(skeleton):
-    total_attempts = skeleton.num_successes + skeleton.num_fails
-    if(total_attempts==0):
-        hit_rate = 'NA'
+def format_ids(ids):
+    return ', '.join(map(str, ids))
+
+def selected_ids(army, input_str):
+    # 'all' is every living member of this army; ids are shared by all types
+    if input_str.strip().lower() == 'all':
+        return army.ids().tolist()
+    return parse_skeleton_ids(input_str)
+
+def display_attack_result(result, name='Skeleton'):
+    # One element for the whole roll, however many undead attacked
+    lines = []
+    for skel_id, damage in zip(result.ids[result.critical_hit], result.damage[result.critical_hit]):
+        lines.append(f"{name} {skel_id} critically hit for {damage} damage.")
+    if result.critical_miss_ids:
+        lines.append(f"{name}s {format_ids(result.critical_miss_ids)} critically missed.")
+    if result.hit_ids:
+        lines.append(f"{name}s {format_ids(result.hit_ids)} hit.")
+    lines.append(f"{result.num_hits} {name.lower()}s hit for {result.total_damage} total damage")
+    st.markdown('  \n'.join(lines))
+
+def display_saving_throw_result(result, name='Skeleton'):
+    lines = []
+    if result.critical_success_ids:
+        lines.append(f"{name}s {format_ids(result.critical_success_ids)} rolled a 20. Critical success on the saving throw.")
+    if result.critical_failure_ids:
+        lines.append(f"{name}s {format_ids(result.critical_failure_ids)} rolled a 1. Critical failure on the saving throw.")
+    if result.success_ids:
+        lines.append(f"{name}s {format_ids(result.success_ids)} succeeded.")
+    if result.collapsed_ids:
+        lines.append(f"{name}s {format_ids(result.collapsed_ids)} have collapsed.")
+    lines.append(f"{result.num_successes} of {result.ids.size} {name.lower()}s saved, taking {result.total_damage} total damage")
+    st.markdown('  \n'.join(lines))
+
+def display_undo_redo(journal):
+    undo_col, redo_col = st.columns(2)
+    with undo_col:
+        if st.button("Undo", disabled=not journal.can_undo()):
+            action = journal.last_action()
+            journal.undo()
+            st.write(f"Undid {action}")
+    with redo_col:
+        if st.button("Redo", disabled=not journal.can_redo()):
+            journal.redo()
+            st.write(f"Redid {journal.last_action()}")
+
+STACKING_HELP = {
+    'stack': 'Add them together',
+    'max': 'Keep the bigger one',
+    'replace': 'Replace the old one',
+}
+
+def display_round(army):
+    if st.button("End Round"):
+        expired = army.advance_round()
+        if expired:
+            st.write(f"{expired} buff(s) wore off")
+    st.write(f"Round {army.effects.round}")
+
+def display_effects(army):
+    effects = army.effects.active_effects()
+    if not effects:
+        return
+    st.dataframe(pd.DataFrame({
+        'Buff': [e.name for e in effects],
+        'Damage': [e.damage_buff for e in effects],
+        'Rounds Left': pd.array([army.effects.rounds_left(e) for e in effects], dtype='Int64'),
+        'Skeletons': [e.ids.size for e in effects],
+    }), hide_index=True)
+
+def display_combat_log(combat_log):
+    # Only the in-memory tail; the full log is on disk (see combatlog.py)
+    entries = combat_log.tail() if combat_log is not None else []
+    if not entries:
+        return
+    with st.expander(f'Combat Log (last {len(entries)})'):
+        log = pd.DataFrame(entries[::-1])
+        log['time'] = pd.to_datetime(log['time'], unit='s').dt.strftime('%H:%M:%S')
+        st.dataframe(log, hide_index=True)
+
+def display_army_stats(army):
+    # Read off the army's running totals, nothing is recounted here
+    stats = army.stats
+    summary = stats.summary()
+    if not summary['attacks'] and not summary['saving_throws']:
+        return
+    with st.expander('Army Stats'):
+        damage_per_round = summary['damage_per_round']
+        st.write(f"Attacks: {summary['attacks']} | Hit rate: {format_rate(summary['hit_rate'])} | "
+                 f"Crits: {format_rate(summary['critical_hit_rate'])} | "
+                 f"Critical misses: {format_rate(summary['critical_miss_rate'])}")
+        st.write(f"Damage done: {summary['damage_done']} | Per round: "
+                 f"{'NA' if damage_per_round is None else round(damage_per_round, 1)}")
+        st.write(f"Saving throws: {summary['saving_throws']} | Saved: {format_rate(summary['save_rate'])} | "
+                 f"Natural 20s: {format_rate(summary['critical_save_rate'])} | Damage taken: {summary['damage_taken']}")
+
+        histogram = stats.histogram()
+        st.bar_chart(pd.DataFrame({'Rolls': histogram}, index=range(1, 21)), x_label='d20', y_label='Rolls')
+        statistic, p_value = chi_square_fairness(histogram)
+        if histogram.sum() < 100:
+            st.write(f"Only {histogram.sum()} rolls so far, too few to judge the dice.")
+        elif p_value < 0.01:
+            st.write(f"These dice look loaded: rolls this uneven happen {p_value:.2%} of the time "
+                     f"with fair dice (chi-square {statistic:.1f}).")
+        else:
+            st.write(f"The dice look fair (chi-square {statistic:.1f}, p = {p_value:.2f}).")
+
+def display_army_table(army):
+    # The whole roster goes to the browser as a single dataframe element
+    roster = army.to_dataframe()
+    roster.insert(1, 'Status', np.array(HEALTH_ICONS)[health_bucket(roster['Health'], roster['Max Health'])])
+    roster['Hit Rate'] *= 100
+    st.dataframe(roster, hide_index=True, column_config={
+        'Hit Rate': st.column_config.NumberColumn(format='%.1f%%'),
+    })
+
+def select_army_page(num_skeletons):
+    view = st.radio('Army view', ['Cards', 'Table'], horizontal=True)
+    if view == 'Table':
+        return view, 0, num_skeletons
+
+    page_size = st.selectbox('Skeletons per page', PAGE_SIZES)
+    num_pages = max(1, int(math.ceil(num_skeletons/page_size)))
+    page = st.number_input(f'Page (of {num_pages})', min_value=1, max_value=num_pages, value=1)
+    start = (int(page) - 1) * page_size
+    return view, start, min(start + page_size, num_skeletons)
+
+@st.cache_data(max_entries=32)
+def attack_odds(damage_buffs, armor_class, attack_type, target_health, stat_block, _profile):
+    # Cached so the sidebar only recomputes when its inputs or the buffs change.
+    # The stat block is part of the key (the profile, with its leading
+    # underscore, isn't hashed), so a type registered again is recomputed
+    return exact_attack_odds(damage_buffs, armor_class, attack_type, target_health, _profile)
+
+def display_attack_odds(army):
+    st.header('Attack Odds')
+    armor_class = st.number_input("Target AC", min_value=1, max_value=30, value=15)
+    target_health = st.number_input("Target HP", min_value=1, value=100)
+    attack_type = st.selectbox("Attack type", army.profile.attack_types, key='odds_attack_type')
+
+    damage_buffs = tuple(army_damage_buffs(army).tolist())
+    if not damage_buffs:
+        st.write(f"No {army.undead_type.lower()}s in the army.")
+        return
+    odds = attack_odds(damage_buffs, int(armor_class), attack_type, int(target_health),
+                       army.profile.stat_block.to_dict(), army.profile)
+    percentiles = odds['damage_percentiles']
+    single = get_odds_table().lookup(int(armor_class), attack_type, 0, army.profile)
+    st.write(f"Each attack: {single.p_hit*100:.0f}% hit, {single.p_crit*100:.0f}% crit, "
+             f"{single.expected_damage:.1f} damage before buffs")
+    st.write(f"Expected damage: {odds['mean_damage']:.1f}")
+    st.write(f"Damage 5%-95%: {percentiles[5]:.0f} - {percentiles[95]:.0f} (median {percentiles[50]:.0f})")
+    st.write(f"Chance to deal {int(target_health)}+ damage: {odds['kill_probability']*100:.1f}%")
+    st.bar_chart(pd.DataFrame({'Probability': odds['hit_distribution']}), x_label='Hits', y_label='Probability')
+
+@st.cache_data(max_entries=16)
+def encounter_odds(damage_buffs, health, monster, attack_type, horde_armor_class, stat_block, _profile):
+    # Fights are split across every core; cached, by stat block as in
+    # attack_odds, so reruns don't fight again
+    return simulate_encounters(np.array(damage_buffs), np.array(health), [monster], attack_type, _profile,
+                               horde_armor_class, num_encounters=10_000, workers=os.cpu_count(), seed=0)
+
+def display_encounter(army):
+    st.header('Encounter')
+    with st.form('encounter'):
+        name = st.text_input("Monster", value='Ogre')
+        health = st.number_input("Monster HP", min_value=1, value=59)
+        armor_class = st.number_input("Monster AC", min_value=1, max_value=30, value=11, key='encounter_ac')
+        attacks = st.number_input("Attacks per round", min_value=0, value=1)
+        to_hit = st.number_input("Attack bonus", value=6)
+        dice = st.text_input("Attack damage", value='2d8+4', help="Dice and bonus, e.g. 2d8+4.")
+        save_targets = st.number_input("Undead caught by its area attack", min_value=0, value=0)
+        save_dc = st.number_input("Area attack DC", min_value=1, max_value=30, value=13)
+        save_damage = st.number_input("Area attack damage", min_value=0, value=0)
+        recharge = st.slider("Chance the area attack is ready", 0.0, 1.0, 1.0)
+        horde_ac = st.number_input(f"{army.undead_type} AC", min_value=1, max_value=30, value=13)
+        attack_type = st.selectbox("Attack type", army.profile.attack_types, key='encounter_attack_type')
+        simulate = st.form_submit_button('Simulate 10,000 Fights')
+    if not simulate:
+        return
+    damage_buffs, current_health = army_horde(army)
+    if not damage_buffs.size:
+        st.write(f"No {army.undead_type.lower()}s in the army.")
+        return
+    try:
+        count, _, rest = dice.lower().replace(' ', '').partition('d')
+        sides, _, bonus = rest.replace('-', '+-').partition('+')
+        monster = Monster(name, int(health), int(armor_class), int(attacks), int(to_hit), int(bonus or 0),
+                          (int(count or 1), int(sides)), int(save_targets), int(save_dc), int(save_damage),
+                          recharge=float(recharge))
+    except ValueError:
+        st.write(f"Can't read attack damage {dice!r}, expected e.g. 2d8+4.")
+        return
+    odds = encounter_odds(tuple(damage_buffs.tolist()), tuple(current_health.tolist()), monster, attack_type,
+                          int(horde_ac), army.profile.stat_block.to_dict(), army.profile)
+    st.write(f"Win: {odds['win_probability']*100:.1f}%, loss: {odds['loss_probability']*100:.1f}%, "
+             f"draw: {odds['draw_probability']*100:.1f}%")
+    if odds['rounds_to_win']['mean'] is not None:
+        st.write(f"Rounds to kill {name}: {odds['rounds_to_win']['mean']:.1f} on average")
+    st.write(f"{army.undead_type}s lost: {odds['undead_lost']['mean']:.1f} on average")
+    st.bar_chart(pd.DataFrame({'Probability': odds['undead_lost']['distribution']}),
+                 x_label=f'{army.undead_type}s lost', y_label='Probability')
+
+SWEEP_METRICS = {'mean_damage': 'Expected damage', 'kill_probability': 'Kill chance'}
+SWEEP_AXES = {'army_size': 'Army size', 'damage_buff': 'Damage buff'}
+
+def sweep_heatmap(df, metric, attack_type, rows, fixed):
+    # One slice of the grid: target AC across, army size or buff down
+    other = 'damage_buff' if rows == 'army_size' else 'army_size'
+    df = df[(df['attack_type'] == attack_type) & (df[other] == fixed)]
+    return alt.Chart(df).mark_rect().encode(
+        x=alt.X('armor_class:O', title='Target AC'),
+        y=alt.Y(f'{rows}:O', title=SWEEP_AXES[rows], sort='descending'),
+        color=alt.Color(f'{metric}:Q', title=SWEEP_METRICS[metric]),
+        tooltip=['armor_class', 'army_size', 'damage_buff', 'mean_damage', 'kill_probability'],
+    )
+
+def display_sweep(army):
+    with st.expander('Damage Sweep'):
+        target_health = st.number_input("Target HP", min_value=1, value=100, key='sweep_health')
+        metric = st.selectbox("Show", list(SWEEP_METRICS), format_func=SWEEP_METRICS.get)
+        attack_type = st.selectbox("Attack type", army.profile.attack_types, key='sweep_attack_type')
+        rows = st.selectbox("Rows", list(SWEEP_AXES), format_func=SWEEP_AXES.get)
+        if rows == 'army_size':
+            fixed = st.slider("Damage buff", DAMAGE_BUFFS.start, DAMAGE_BUFFS.stop - 1, 0)
+        else:
+            fixed = st.slider("Army size", ARMY_SIZES.start, ARMY_SIZES.stop - 1, 10)
+        # The last sweep's grid is kept, so other reruns only redraw the slice.
+        # A new stat block or target HP needs a new sweep
+        key = (army.profile, int(target_health))
+        shown = st.session_state.get('sweep_shown')
+        run = st.button("Run Sweep") or (shown is not None and shown[0] != key)
+        if not run:
+            if shown is not None:
+                st.altair_chart(sweep_heatmap(shown[1], metric, attack_type, rows, fixed), width='stretch')
+            return
+
+        # Finished cells come back from the sweep cache, new ones stream in
+        chart = st.empty()
+        cells = []
+        drawn = 0
+        for finished in sweep(army.profile, target_health=int(target_health), workers=os.cpu_count()):
+            cells.extend(finished)
+            if time.perf_counter() - drawn > 0.5:
+                chart.altair_chart(sweep_heatmap(pd.DataFrame(cells), metric, attack_type, rows, fixed), width='stretch')
+                drawn = time.perf_counter()
+        df = pd.DataFrame(cells)
+        st.session_state['sweep_shown'] = (key, df)
+        chart.altair_chart(sweep_heatmap(df, metric, attack_type, rows, fixed), width='stretch')
+
+def select_army(undead_hoard):
+    # Only ask which hoard to command once there is more than one
+    if not undead_hoard:
+        return None
+    names = list(undead_hoard)
+    if len(names) == 1:
+        return undead_hoard[names[0]]
+    return undead_hoard[st.selectbox('Which hoard?', names, key='active_hoard')]
+
+def select_campaign():
+    # With a campaign id the hoard lives in the process-wide store, shared
+    # by every tab on that campaign, instead of in this tab's session
+    campaign_id = st.text_input('Campaign ID', help="Leave blank to keep the army to this tab.").strip()
+    if campaign_id:
+        try:
+            check_campaign_id(campaign_id)
+        except ValueError as e:
+            st.write(str(e))
+            campaign_id = ''
+    if not campaign_id and st.session_state.get('campaign_id'):
+        # Leaving a campaign starts this tab on a fresh hoard
+        st.session_state['undead_hoard'] = {}
+    st.session_state['campaign_id'] = campaign_id
+    return campaign_id
+
+def display_metrics():
+    # Off by default; while on, actions, renders and whole reruns are timed
+    st.header('Performance')
+    if st.checkbox('Collect timings', value=instrumentation.is_enabled()):
+        instrumentation.enable()
     else:
-        hit_rate = skeleton.num_successes / total_attempts
-        hit_rate = str(round(hit_rate * 100,2))+'%'
+        instrumentation.disable()
+    if st.button('Reset timings'):
+        instrumentation.reset()
+
+    metrics = instrumentation.snapshot()
+    if metrics['timings']:
+        timings = pd.DataFrame.from_dict(metrics['timings'], orient='index')
+        st.dataframe(timings.round(3))
+    if metrics['counters']:
+        st.dataframe(pd.Series(metrics['counters'], name='count'))
+    st.write("Odds table: {rows} rows, {hits} hits, {misses} misses".format(**get_odds_table().stats()))
+    if metrics['timings'] or metrics['counters']:
+        buffer = io.StringIO()
+        instrumentation.export_jsonl(buffer)
+        st.download_button("Download Timings", data=buffer.getvalue(),
+                           file_name="necro_timings.jsonl", mime="application/jsonl")
+
+def display_skeleton_stats(skeleton):
+    hit_rate = success_rate(skeleton)
 
     st.write('\n')
     st.write(f"Health = {str(skeleton.current_health)}/{str(skeleton.max_health)}")
@@ -137,6 +467,7 @@ def display_skeleton_stats(skeleton):
 # Streamlit APP
 ###########################################################################
 st.set_page_config(layout="wide")
+rerun_start = time.perf_counter()
 
 # Create font color markdown variables 
 st.markdown(
@@ -214,12 +545,14 @@ st.markdown(
 if 'undead_hoard' not in st.session_state:
     st.session_state['undead_hoard'] = {}
 
+with st.sidebar:
+    campaign_id = select_campaign()
+
 # Create a space column on the left, then the title, and then the image on the right
 col_image, col_title,space, download,upload = st.columns([1,0.5,3,1,2])
-title_image_path = '/Users/scottsmacbook/dnd_necromancer_helper/photos/Sally.jpeg'  # Replace with the actual path
 
 with col_image:
-    st.image(title_image_path)
+    st.image(load_title_image())
 with col_title:
     st.title("Necromancers Army")
 
@@ -227,122 +560,196 @@ with col_title:
 # col1,col2,vertical_line,outputs = st.columns([2.5,2.5,0.1,1.5])
 col1,vertical_line,outputs1,space1,outputs2,space2,outputs3,space3 = st.columns([1.5,0.1,0.8,0.2,0.8,0.2,0.8,0.2])
 
-if 'undead_hoard' in st.session_state:
-    undead_hoard = st.session_state['undead_hoard']
-
-if 'Skeleton' in undead_hoard:
-    skeleton_army = undead_hoard['Skeleton']
+# Healthy, damaged and nearly defeated sprites, scaled down and cached once per process
+images = load_skeleton_sprites()
+
+# Other tabs on the same campaign run in their own threads, so everything
+# below that acts on, saves or draws the armies happens with the campaign
+# checked out. Its armies, and their undo history, are shared with those tabs.
+if campaign_id:
+    checkout = get_campaign_store().checkout(campaign_id)
+else:
+    checkout = nullcontext(st.session_state['undead_hoard'])
+
+with col1, checkout as undead_hoard:
+    st.session_state['undead_hoard'] = undead_hoard
+
+    # Uploaded armies come without a journal or combat log. Armies shared
+    # through a campaign keep the log of the tab that first picked them up
+    combat_log = st.session_state.setdefault('combat_log', CombatLog())
+    for army in undead_hoard.values():
+        if army.journal is None:
+            army.journal = Journal(army)
+        if army.combat_log is None:
+            army.combat_log = combat_log
 
-with col1: 
     # Dropdown menu
-    option = st.selectbox('What would you like to do?', ['Raise Hoard','Add Undead to Existing Hoard','Attack', 'Roll Saving Throws', 'Buff Army'])
+    option = st.selectbox('What would you like to do?', ['Raise Hoard','Add Undead to Existing Hoard','Attack', 'Roll Saving Throws', 'Damage or Heal', 'Buff Army'])
+    skeleton_army = select_army(undead_hoard)
+    if skeleton_army is None and option in ('Attack', 'Roll Saving Throws', 'Damage or Heal', 'Buff Army'):
+        st.write("Raise a hoard first.")
+        option = None
 
     # Check if the user selects 'Other'
     if option == 'Raise Hoard':
-        raise_hoard(st.session_state['undead_hoard'])
+        with span('action.raise_hoard'):
+            raise_hoard(st.session_state['undead_hoard'])
     
     if option == 'Add Undead to Existing Hoard':
-        add_undead(st.session_state['undead_hoard'])
+        with span('action.add_undead'):
+            add_undead(st.session_state['undead_hoard'])
 
     if option == 'Roll Saving Throws':
-        input_str = st.text_input("Enter the IDs of attacking skeletons (e.g., '1-3, 5'): ")
-
-        if input_str.lower() == 'all':
-            input_str = '1-50'
+        input_str = st.text_input("Enter the IDs of attacking skeletons (e.g., '1-3, 5, all'): ")
 
         dc = st.text_input("Enter the Difficulty Check (DC) for the saving throw: ")
         potential_damage = st.text_input("Enter the potential damage on a failed save: ")
         ability_type = st.selectbox("Enter the ability for the saving throw: ",['Strength','Dexterity','Constitution','Intelligence','Wisdom','Charisma'])
 
         if ((dc != '') and (input_str != '') and (potential_damage != '')):   
-            affected_skeleton_ids = parse_skeleton_ids(input_str)
+            affected_skeleton_ids = selected_ids(skeleton_army, input_str)
             if st.button("Roll"):
-                skeleton_army.group_saving_throw(affected_skeleton_ids, int(dc), int(potential_damage), ability_type)
+                with span('action.saving_throw'):
+                    result = skeleton_army.group_saving_throw(affected_skeleton_ids, int(dc), int(potential_damage), ability_type)
+                    display_saving_throw_result(result, skeleton_army.undead_type)
 
     if option == 'Attack':
         input_str = st.text_input("Enter the IDs of attacking skeletons (e.g., '1-3, 5, all'): ")
-        if input_str.lower() == 'all':
-            input_str = '1-50'
         armor_class = st.text_input("Enter the target's Armor Class (AC): ")
-        attack_type = st.selectbox("Enter the attack type:", ['None','sword','bow'])
+        attack_type = st.selectbox("Enter the attack type:", ['None', *skeleton_army.profile.attack_types])
 
         if (attack_type!='None' and (input_str != '') and (armor_class != '')):
-            attacking_skeleton_ids = parse_skeleton_ids(input_str)
+            attacking_skeleton_ids = selected_ids(skeleton_army, input_str)
             armor_class = int(armor_class)
             if st.button("Roll"):
-                skeleton_army.group_attack(attacking_skeleton_ids, armor_class, attack_type)
+                with span('action.attack'):
+                    result = skeleton_army.group_attack(attacking_skeleton_ids, armor_class, attack_type)
+                    display_attack_result(result, skeleton_army.undead_type)
+
+    if option == 'Damage or Heal':
+        input_str = st.text_input("Enter the IDs of the affected skeletons (e.g., '1-3, 5, all'): ")
+        amounts_str = st.text_area("Enter one amount for all of them, or one per ID (e.g. pasted from a spreadsheet column): ")
+        heal = st.radio("Damage or heal?", ['Damage', 'Heal'], horizontal=True) == 'Heal'
+        damage_type = st.selectbox("Damage type: ", ['None', *DAMAGE_TYPES], disabled=heal)
+        modifier = st.selectbox("Resistance: ", ['From stat block', *DAMAGE_MODIFIERS], disabled=heal)
+
+        if input_str != '' and amounts_str.strip() != '':
+            skeleton_ids = selected_ids(skeleton_army, input_str)
+            amounts = parse_amounts(amounts_str)
+            if len(amounts) not in (1, len(skeleton_ids)):
+                st.write(f"Got {len(amounts)} amounts for {len(skeleton_ids)} IDs.")
+            elif st.button("Apply"):
+                with span('action.health'):
+                    amounts = np.array(amounts)
+                    collapsed = skeleton_army.apply_health(
+                        skeleton_ids, -np.abs(amounts) if heal else amounts,
+                        None if modifier == 'From stat block' else modifier,
+                        None if damage_type == 'None' else damage_type)
+                name = skeleton_army.undead_type
+                st.write(f"{'Healed' if heal else 'Damaged'} {len(skeleton_ids)} {name.lower()}s.")
+                if collapsed.size:
+                    st.write(f"{name}s {format_ids(collapsed.tolist())} have collapsed.")
 
     if option == 'Buff Army':
         damage_buff = st.text_input("Enter the damage buff: ")
-        duration = st.text_input("Enter the duration of the buff: ")
+        duration = st.text_input("Enter the duration of the buff in rounds: ")
+        buff_name = st.text_input("Name of the buff: ", value='buff')
+        stacking = st.selectbox("If a buff with that name is already active: ", list(STACKING_HELP),
+                                format_func=STACKING_HELP.get)
         if st.button("Apply Buff"):
-            skeleton_army.add_damage_buff(damage_buff,duration)
+            with span('action.buff'):
+                skeleton_army.add_damage_buff(damage_buff, duration, buff_name or 'buff', stacking)
             st.write(f'Added a damage buff of {damage_buff} to the army')
 
         if st.button("Reset Buff"):
             skeleton_army.reset_buff()
-
-    
-healthy_skelly_image_path = '/Users/scottsmacbook/dnd_necromancer_helper/photos/Health Skeleton.png'
-damaged_skelly_image_path = '/Users/scottsmacbook/dnd_necromancer_helper/photos/Damaged Skeleton.png'
-almost_dead_skelly_image_path = '/Users/scottsmacbook/dnd_necromancer_helper/photos/Nearly Defeated Skeleton.png'
-
-# healthy_skelly_image_path = 'photos/Health Skeleton.png'
-# damaged_skelly_image_path = 'photos/Damaged Skeleton.png'
-# almost_dead_skelly_image_path = 'photos/Nearly Defeated Skeleton.png'
-
-images = []
-images.append(healthy_skelly_image_path)
-images.append(damaged_skelly_image_path)
-images.append(almost_dead_skelly_image_path)
-
-
-
-with download:
-    if 'undead_hoard' in st.session_state:
-        if st.button("Convert Data to pkl"):
-        # Serialize the object
-            buffer = io.BytesIO()
-            pickle.dump(undead_hoard, buffer)
-            buffer.seek(0)
-            st.download_button(
-                label="Download Army Data",
-                data=buffer,
-                file_name="unead_army.pkl",
-                mime="application/octet-stream"
-            )
-        
-with upload:
-    uploaded_file = st.file_uploader("Upload Undead Army pkl File", type=["pkl"])
-    if ((uploaded_file is not None) and ('file_uploaded' not in st.session_state)) :
-        st.session_state['undead_hoard'] = pickle.load(uploaded_file)
-        undead_hoard = st.session_state['undead_hoard']
-        st.session_state['file_uploaded'] = True
-
-
-if 'Skeleton' in undead_hoard:
-    skeleton_army = undead_hoard['Skeleton']
-    skeletons = skeleton_army.get_skeletons()
-    num_skeletons = len(skeletons)
-    num_rows = int(math.ceil(num_skeletons/3))
-
-    with vertical_line:
-        num_line_pixels = 450*num_rows
-        line_len = str(num_line_pixels)+'px'
-        st.markdown(f'<div style="border-left: 2px solid #808080; height: {line_len}"></div>', unsafe_allow_html=True)
-
-    with outputs1:
-        group_1 = skeletons[0::3]
-        for skeleton in group_1:
-            display_skeleton_image(skeleton,images)
-    
-    with outputs2: 
-        group_2 = skeletons[1::3]
-        for skeleton in group_2:
-            display_skeleton_image(skeleton,images)
-
-
-    with outputs3:
-        group_3 = skeletons[2::3]
-        for skeleton in group_3:
-            display_skeleton_image(skeleton,images)
+        # Filled in below, once End Round and Undo have had their say
+        effects_table = st.empty()
+
+    # The first hoard may have been raised just above
+    if skeleton_army is None:
+        skeleton_army = select_army(undead_hoard)
+    if skeleton_army is not None:
+        display_undo_redo(skeleton_army.journal)
+        display_round(skeleton_army)
+        display_combat_log(skeleton_army.combat_log)
+        display_army_stats(skeleton_army)
+        if option == 'Buff Army':
+            with effects_table.container():
+                display_effects(skeleton_army)
+
+    with download:
+        if 'undead_hoard' in st.session_state:
+            if st.button("Prepare Army Save File"):
+                with span('action.save'):
+                    save_data = save_hoard_bytes(undead_hoard)
+                st.download_button(
+                    label="Download Army Data",
+                    data=save_data,
+                    file_name=f"undead_army.{FILE_EXTENSION}",
+                    mime="application/octet-stream"
+                )
+
+    with upload:
+        # Old .pkl saves can still be loaded, they are converted on upload
+        uploaded_file = st.file_uploader("Upload Undead Army File", type=[FILE_EXTENSION, "pkl"])
+        if ((uploaded_file is not None) and ('file_uploaded' not in st.session_state)) :
+            try:
+                with span('action.load'):
+                    st.session_state['undead_hoard'] = load_hoard(uploaded_file)
+                    if campaign_id:
+                        get_campaign_store().put(campaign_id, st.session_state['undead_hoard'])
+            except SaveFormatError as e:
+                st.write(f"Could not load the army file: {e}")
+            else:
+                st.session_state['file_uploaded'] = True
+                # Start over so the loaded hoard gets journals and a hoard picker
+                st.rerun()
+
+
+    if skeleton_army is not None:
+        with st.sidebar, span('render.odds'):
+            display_attack_odds(skeleton_army)
+        with st.sidebar, span('render.encounter'):
+            display_encounter(skeleton_army)
+
+        with col1:
+            with span('render.sweep'):
+                display_sweep(skeleton_army)
+            view, start, stop = select_army_page(len(skeleton_army))
+
+        if view == 'Table':
+            with span('render.table'):
+                display_army_table(skeleton_army)
+        else:
+            # Only the skeletons on the current page get full cards
+            skeletons = [Skeleton(skeleton_army, skel_id) for skel_id in skeleton_army.ids()[start:stop].tolist()]
+            num_rows = int(math.ceil(len(skeletons)/3))
+
+            with vertical_line:
+                num_line_pixels = 450*num_rows
+                line_len = str(num_line_pixels)+'px'
+                st.markdown(f'<div style="border-left: 2px solid #808080; height: {line_len}"></div>', unsafe_allow_html=True)
+
+            render_start = time.perf_counter()
+            with outputs1:
+                group_1 = skeletons[0::3]
+                for skeleton in group_1:
+                    display_skeleton_image(skeleton,images)
+
+            with outputs2:
+                group_2 = skeletons[1::3]
+                for skeleton in group_2:
+                    display_skeleton_image(skeleton,images)
+
+            with outputs3:
+                group_3 = skeletons[2::3]
+                for skeleton in group_3:
+                    display_skeleton_image(skeleton,images)
+            observe('render.cards', time.perf_counter() - render_start)
+
+with st.sidebar:
+    display_metrics()
+
+# Everything above, including the sidebar, counts toward the cost of a rerun
+observe('app.rerun', time.perf_counter() - rerun_start)
@@ -0,0 +1,35 @@
+import io
+from pathlib import Path
+import streamlit as st
+from PIL import Image
+
+# photos/ sits next to the Streamlit/ folder in the repo
+PHOTOS_DIR = Path(__file__).resolve().parent.parent / 'photos'
+
+# Healthy, damaged and nearly defeated, in the order app.health_bucket uses
+SKELETON_SPRITES = ('Health Skeleton.png', 'Damaged Skeleton.png', 'Nearly Defeated Skeleton.png')
+TITLE_IMAGE = 'Sally.jpeg'
+
+SPRITE_SIZE = 256
+TITLE_SIZE = 192
+
+def _thumbnail_bytes(file_name, size):
+    # Shrink the image to fit in a size x size box and re-encode it in memory
+    with Image.open(PHOTOS_DIR / file_name) as image:
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+@st.cache_resource
+def load_skeleton_sprites(size=SPRITE_SIZE):
+    """
+    The three health-state skeleton sprites as PNG bytes, loaded and scaled
+    once per process. Every card reuses the same bytes, so Streamlit serves
+    each sprite from a single cached media URL.
+    """
+    return [_thumbnail_bytes(file_name, size) for file_name in SKELETON_SPRITES]
+
+@st.cache_resource
+def load_title_image(size=TITLE_SIZE):
+    return _thumbnail_bytes(TITLE_IMAGE, size)
@@ -0,0 +1,159 @@
+"""
+Times the main army operations across army and selection sizes.
+
+    python benchmark.py --sizes 10 1000 100000 --output results.json
+
+For every (operation, army size, selection size) it reports throughput in
+skeletons per second, p50/p99 latency and peak traced memory, and writes
+the results as JSON so runs can be compared over time.
+"""
+import argparse
+import contextlib
+import io
+import json
+import pickle
+import platform
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+from classes import SkeletonArmy
+from utils import parse_skeleton_ids
+from savefile import load_hoard, save_hoard_bytes
+
+DEFAULT_SIZES = [10, 1_000, 100_000]
+DEFAULT_SELECTIONS = ['1', '10', 'all']
+
+def make_army(size, seed=0):
+    army = SkeletonArmy(health=47, attack_bonus=13, dex_bonus=2, seed=seed)
+    army.add_skeletons(size)
+    return army
+
+def army_ids(army):
+    return list(army.export_columns()['id'].tolist())
+
+# Each operation is (setup, run). setup builds fresh state outside the timed
+# region and returns the arguments run is called with.
+def _add_setup(size, selected):
+    return (make_army(0), selected)
+
+def _army_setup(size, selected):
+    army = make_army(size)
+    return (army, army_ids(army)[:selected])
+
+def _hoard_setup(size, selected):
+    return ({'Skeleton': make_army(size)},)
+
+def _binary_load_setup(size, selected):
+    return (save_hoard_bytes({'Skeleton': make_army(size)}),)
+
+def rolled_army(size):
+    # After a volley every skeleton has roll statistics to save as well
+    army = make_army(size)
+    army.group_attack(army_ids(army), 15, 'sword')
+    return army
+
+def _rolled_hoard_setup(size, selected):
+    return ({'Skeleton': rolled_army(size)},)
+
+def _rolled_load_setup(size, selected):
+    return (save_hoard_bytes({'Skeleton': rolled_army(size)}),)
+
+def _pickle_load_setup(size, selected):
+    return (pickle.dumps({'Skeleton': make_army(size)}),)
+
+def _ids_text_setup(size, selected):
+    return (f"1-{selected}",)
+
+OPERATIONS = {
+    'add_skeletons': (_add_setup, lambda army, count: army.add_skeletons(count)),
+    'group_attack': (_army_setup, lambda army, ids: army.group_attack(ids, 15, 'sword')),
+    'group_saving_throw': (_army_setup, lambda army, ids: army.group_saving_throw(ids, 15, 20, 'dexterity')),
+    'update_health': (_army_setup, lambda army, ids: army.update_health({i: 10 for i in ids})),
+    'remove_skeletons': (_army_setup, lambda army, ids: army.remove_skeletons(ids)),
+    'parse_skeleton_ids': (_ids_text_setup, parse_skeleton_ids),
+    'save_binary': (_hoard_setup, save_hoard_bytes),
+    'load_binary': (_binary_load_setup, lambda data: load_hoard(io.BytesIO(data))),
+    'save_binary_rolled': (_rolled_hoard_setup, save_hoard_bytes),
+    'load_binary_rolled': (_rolled_load_setup, lambda data: load_hoard(io.BytesIO(data))),
+    'save_pickle': (_hoard_setup, pickle.dumps),
+    'load_pickle': (_pickle_load_setup, pickle.loads),
+}
+
+# Save/load always work on the whole army, so selection size doesn't apply
+WHOLE_ARMY = {'save_binary', 'load_binary', 'save_binary_rolled', 'load_binary_rolled', 'save_pickle', 'load_pickle'}
+
+def selection_size(selection, army_size):
+    if selection == 'all':
+        return army_size
+    return min(int(selection), army_size)
+
+def time_operation(name, army_size, selected, repeat):
+    setup, run = OPERATIONS[name]
+    timings = []
+    # The operations print progress messages, keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            args = setup(army_size, selected)
+            start = time.perf_counter()
+            run(*args)
+            timings.append(time.perf_counter() - start)
+
+        # Peak memory comes from a separate run so tracing doesn't skew timings
+        args = setup(army_size, selected)
+        tracemalloc.start()
+        run(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    timings = np.array(timings)
+    return {
+        'operation': name,
+        'army_size': army_size,
+        'selection_size': selected,
+        'repeats': repeat,
+        'mean_ms': float(timings.mean() * 1000),
+        'p50_ms': float(np.percentile(timings, 50) * 1000),
+        'p99_ms': float(np.percentile(timings, 99) * 1000),
+        'throughput_per_s': float(selected / np.median(timings)) if selected else None,
+        'peak_memory_bytes': int(peak),
+    }
+
+def run_benchmarks(sizes, selections, operations, repeat):
+    results = []
+    for army_size in sizes:
+        for name in operations:
+            sizes_for_op = [army_size] if name in WHOLE_ARMY else \
+                sorted({selection_size(s, army_size) for s in selections})
+            for selected in sizes_for_op:
+                result = time_operation(name, army_size, selected, repeat)
+                results.append(result)
+                print(f"{name:>20} n={army_size:<7} k={selected:<7} "
+                      f"p50={result['p50_ms']:9.3f}ms p99={result['p99_ms']:9.3f}ms "
+                      f"peak={result['peak_memory_bytes'] / 1024:9.1f}KiB")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="army sizes")
+    parser.add_argument('--selections', nargs='+', default=DEFAULT_SELECTIONS,
+                        help="how many skeletons each action targets, a number or 'all'")
+    parser.add_argument('--operations', nargs='+', default=list(OPERATIONS), choices=list(OPERATIONS))
+    parser.add_argument('--repeat', type=int, default=20, help="timed runs per case")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.selections, args.operations, args.repeat)
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
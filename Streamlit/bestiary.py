@@ -0,0 +1,219 @@
+"""
+Library of undead stat blocks read from a CSV or JSON bestiary.
+
+Opening a bestiary only reads the file and indexes every entry by name and
+challenge rating. A row is turned into a StatBlock the first time it is
+asked for and kept from then on. If the file changes on disk (by mtime or
+size) the indexes and parsed blocks are rebuilt on the next lookup.
+
+CSV files have the columns name, cr, hp, attacks, saves and optionally
+damage (damage resistances, vulnerabilities and immunities), e.g.
+
+    name,cr,hp,attacks,saves,damage
+    Ghast,2,36,claws +5 2d6+3; bite +3 2d8+3,str +3; dex +3; wis +1; cha -1,necrotic resistant; poison immune
+
+JSON files hold a list of StatBlock.to_dict() style objects, with the same
+short attack and save strings also accepted.
+"""
+import bisect
+import csv
+import json
+import os
+import re
+import threading
+from fractions import Fraction
+from pathlib import Path
+from undead import UNDEAD_TYPES, ABILITIES, DAMAGE_MODIFIERS, Attack, StatBlock, register_undead
+
+BESTIARY_PATH = Path(os.environ.get('NECRO_BESTIARY', Path(__file__).resolve().parent.parent / 'bestiary.csv'))
+
+# e.g. "rotting fist +5 2d6+3" or "life drain +4 3d6"
+_ATTACK = re.compile(r'^(?P<name>.+?)\s+(?P<to_hit>[+-]?\d+)\s+(?P<count>\d+)d(?P<sides>\d+)\s*(?P<damage>[+-]\s*\d+)?$')
+_ABILITY_NAMES = {ability[:3]: ability for ability in ABILITIES}
+
+class BestiaryError(ValueError):
+    pass
+
+def parse_challenge_rating(value):
+    # Ratings below 1 are written as fractions, e.g. "1/4"
+    return float(Fraction(str(value).strip() or 0))
+
+def parse_attacks(text):
+    attacks = {}
+    for part in text.split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        match = _ATTACK.match(part)
+        if match is None:
+            raise BestiaryError(f"Can't read attack {part!r}, expected e.g. 'claws +5 2d6+3'.")
+        damage = match['damage'] or '0'
+        attacks[match['name']] = Attack(int(match['to_hit']), int(damage.replace(' ', '')),
+                                        (int(match['count']), int(match['sides'])))
+    return attacks
+
+def parse_saves(text):
+    saves = {}
+    for part in text.split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        ability, bonus = part.rsplit(None, 1)
+        ability = ability.lower()
+        saves[_ABILITY_NAMES.get(ability, ability)] = int(bonus)
+    return saves
+
+def parse_damage_modifiers(text):
+    # e.g. "poison immune; bludgeoning vulnerable"
+    modifiers = {}
+    for part in text.split(';'):
+        part = part.strip()
+        if not part:
+            continue
+        damage_type, _, modifier = part.lower().rpartition(' ')
+        if modifier not in DAMAGE_MODIFIERS or not damage_type:
+            raise BestiaryError(f"Can't read damage modifier {part!r}, expected e.g. 'poison immune'.")
+        modifiers[damage_type.strip()] = modifier
+    return modifiers
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def _read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+class Bestiary:
+    """
+    Stat blocks from one bestiary file. names() and the lookups only touch
+    the indexes, so listing thousands of entries is cheap on every rerun.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self._stamp = None
+        self._rows = []
+        self._by_name = {}
+        self._names = []
+        self._ratings = []  # sorted (challenge rating, name) pairs
+        self._parsed = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stamp = None
+        else:
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return
+        # Every Streamlit session shares this object, only one of them reloads
+        with self._lock:
+            if stamp != self._stamp:
+                self._load(stamp)
+
+    def _load(self, stamp):
+        if stamp is None:
+            rows = []
+        elif self.path.suffix.lower() == '.json':
+            rows = _read_json(self.path)
+        else:
+            rows = _read_csv(self.path)
+
+        by_name = {}
+        ratings = []
+        for position, row in enumerate(rows):
+            name = row['name'].strip()
+            # A later entry with the same name replaces the earlier one
+            by_name[name.lower()] = position
+        for position in by_name.values():
+            row = rows[position]
+            ratings.append((parse_challenge_rating(row.get('cr', row.get('challenge_rating', 0))), row['name'].strip()))
+
+        self._rows = rows
+        self._by_name = by_name
+        self._names = sorted((name for _, name in ratings), key=str.lower)
+        self._ratings = sorted(ratings)
+        self._parsed = {}
+        self._stamp = stamp
+
+    def __len__(self):
+        self._refresh()
+        return len(self._by_name)
+
+    def __contains__(self, name):
+        self._refresh()
+        return name.lower() in self._by_name
+
+    def names(self):
+        self._refresh()
+        return self._names
+
+    def challenge_ratings(self):
+        self._refresh()
+        return sorted({rating for rating, _ in self._ratings})
+
+    def names_by_rating(self, low, high):
+        """Names with low <= challenge rating <= high, lowest rating first."""
+        self._refresh()
+        start = bisect.bisect_left(self._ratings, (low, ''))
+        stop = bisect.bisect_right(self._ratings, (high, chr(0x10FFFF)))
+        return [name for _, name in self._ratings[start:stop]]
+
+    def stat_block(self, name):
+        """The StatBlock for name, parsed on first use."""
+        self._refresh()
+        key = name.lower()
+        block = self._parsed.get(key)
+        if block is None:
+            if key not in self._by_name:
+                raise KeyError(name)
+            block = self._parsed[key] = self._parse(self._rows[self._by_name[key]])
+        return block
+
+    def _parse(self, row):
+        name = row['name'].strip()
+        try:
+            attacks = row['attacks']
+            if isinstance(attacks, str):
+                attacks = parse_attacks(attacks)
+            else:
+                attacks = {n: Attack(a['to_hit'], a['damage'], tuple(a['dice'])) for n, a in attacks.items()}
+            saves = row.get('saves') or {}
+            if isinstance(saves, str):
+                saves = parse_saves(saves)
+            damage_modifiers = row.get('damage') or row.get('damage_modifiers') or {}
+            if isinstance(damage_modifiers, str):
+                damage_modifiers = parse_damage_modifiers(damage_modifiers)
+            health = row.get('hp', row.get('max_health'))
+            return StatBlock(
+                name, max_health=int(health), attacks=attacks, saves=saves,
+                attack_bonus=int(row.get('attack_bonus') or max((a.to_hit for a in attacks.values()), default=0)),
+                dex_bonus=int(row.get('dex_bonus') or saves.get('dexterity', 0)),
+                challenge_rating=parse_challenge_rating(row.get('cr', row.get('challenge_rating', 0))),
+                damage_modifiers=damage_modifiers,
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise BestiaryError(f"Bad bestiary entry for {name}: {e}") from e
+
+    def register(self, name):
+        """
+        Make name available to armies, registering it again if the bestiary
+        changed since it was last registered. Returns its UndeadProfile.
+        """
+        block = self.stat_block(name)
+        profile = UNDEAD_TYPES.get(block.name)
+        if profile is None or profile.stat_block is not block:
+            profile = register_undead(block)
+        return profile
+
+_BESTIARIES = {}
+
+def get_bestiary(path=BESTIARY_PATH):
+    """One shared Bestiary per file, so reruns reuse its indexes."""
+    path = Path(path).resolve()
+    bestiary = _BESTIARIES.get(path)
+    if bestiary is None:
+        bestiary = _BESTIARIES[path] = Bestiary(path)
+    return bestiary
@@ -0,0 +1,187 @@
+"""
+Process-wide store of undead hoards, keyed by campaign id.
+
+Every Streamlit session in the process shares one CampaignStore, so two
+tabs (or two players) on the same campaign see the same armies. At most
+max_campaigns hoards, holding at most max_skeletons undead between them,
+stay in memory. The least recently used ones beyond that are written to
+campaign_dir in the binary save format and read back transparently the
+next time they are asked for.
+
+Each tab runs in its own thread, so anything that changes a campaign's
+armies happens inside checkout(), which lets one caller at a time at the
+campaign and keeps its hoard from being evicted meanwhile. The armies
+themselves are shared, journals included: undo in one tab takes back the
+last action on that army from any tab.
+
+Undo history isn't kept for evicted hoards; the app attaches a new
+journal when one comes back.
+"""
+import atexit
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from savefile import FILE_EXTENSION, read_hoard, write_hoard
+
+CAMPAIGN_DIR = Path(os.environ.get('NECRO_CAMPAIGNS', Path(__file__).resolve().parent.parent / 'campaigns'))
+
+# Campaign ids become file names, so keep them to a safe alphabet
+_CAMPAIGN_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def check_campaign_id(campaign_id):
+    if not _CAMPAIGN_ID.match(campaign_id):
+        raise ValueError("Campaign IDs may only use letters, digits, '-' and '_' (at most 64).")
+    return campaign_id
+
+class CampaignStore:
+    def __init__(self, campaign_dir=CAMPAIGN_DIR, max_campaigns=16, max_skeletons=500_000):
+        self.campaign_dir = Path(campaign_dir)
+        self.max_campaigns = max_campaigns
+        self.max_skeletons = max_skeletons
+        self._hot = OrderedDict()  # campaign id -> hoard, least recently used first
+        self._lock = threading.RLock()
+        # Campaigns in use, with their lock and how many callers hold or wait for it
+        self._locks = {}
+        self._pins = {}
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def _path(self, campaign_id):
+        return self.campaign_dir / f"{check_campaign_id(campaign_id)}.{FILE_EXTENSION}"
+
+    def __contains__(self, campaign_id):
+        with self._lock:
+            return campaign_id in self._hot or self._path(campaign_id).exists()
+
+    def get(self, campaign_id, create=True):
+        """
+        The campaign's hoard, loaded from disk if it was evicted. A campaign
+        that doesn't exist yet gets a new empty hoard, or with create=False
+        raises KeyError.
+        """
+        path = self._path(campaign_id)
+        with self._lock:
+            hoard = self._hot.get(campaign_id)
+            if hoard is not None:
+                self._hot.move_to_end(campaign_id)
+                self.hits += 1
+            elif path.exists():
+                with open(path, 'rb') as f:
+                    hoard = self._hot[campaign_id] = read_hoard(f)
+                self.loads += 1
+            elif create:
+                hoard = self._hot[campaign_id] = {}
+            else:
+                raise KeyError(campaign_id)
+            # Armies grow between calls, so the budget is checked on every access
+            self._evict_extra()
+            return hoard
+
+    def put(self, campaign_id, hoard):
+        """Replace the campaign's hoard, e.g. with an uploaded save."""
+        with self.pin(campaign_id), self._locks[campaign_id], self._lock:
+            self._hot[campaign_id] = hoard
+            self._hot.move_to_end(campaign_id)
+            self._evict_extra()
+
+    @contextmanager
+    def pin(self, campaign_id):
+        """Keep the campaign's hoard from being evicted until the block ends."""
+        self._path(campaign_id)
+        with self._lock:
+            self._pins[campaign_id] = self._pins.get(campaign_id, 0) + 1
+            self._locks.setdefault(campaign_id, threading.RLock())
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins[campaign_id] -= 1
+                if not self._pins[campaign_id]:
+                    del self._pins[campaign_id]
+                    del self._locks[campaign_id]
+
+    @contextmanager
+    def checkout(self, campaign_id, create=True):
+        """
+        Wait until nobody else is using the campaign, then yield its hoard
+        (as get), which stays in memory until the block ends.
+        """
+        with self.pin(campaign_id), self._locks[campaign_id]:
+            yield self.get(campaign_id, create)
+
+    def _evict_extra(self):
+        # The most recently used hoard always stays, however big it is, and
+        # so do checked out ones
+        total = sum(len(army) for hoard in self._hot.values() for army in hoard.values())
+        for campaign_id in list(self._hot)[:-1]:
+            if len(self._hot) <= self.max_campaigns and total <= self.max_skeletons:
+                break
+            if campaign_id in self._pins:
+                continue
+            hoard = self._hot.pop(campaign_id)
+            self._write(campaign_id, hoard)
+            total -= sum(len(army) for army in hoard.values())
+            self.evictions += 1
+
+    def _write(self, campaign_id, hoard):
+        path = self._path(campaign_id)
+        self.campaign_dir.mkdir(parents=True, exist_ok=True)
+        # Write next to the old file and swap, so a crash never leaves half a save
+        partial = path.with_name(path.name + '.partial')
+        with open(partial, 'wb') as f:
+            write_hoard(hoard, f)
+        os.replace(partial, path)
+
+    def evict(self, campaign_id):
+        with self._lock:
+            if campaign_id in self._pins:
+                return
+            hoard = self._hot.pop(campaign_id, None)
+            if hoard is not None:
+                self._write(campaign_id, hoard)
+                self.evictions += 1
+
+    def flush(self):
+        """Write every hoard in memory to disk, keeping them in memory."""
+        with self._lock:
+            for campaign_id, hoard in self._hot.items():
+                self._write(campaign_id, hoard)
+
+    def delete(self, campaign_id):
+        path = self._path(campaign_id)
+        with self._lock:
+            self._hot.pop(campaign_id, None)
+            path.unlink(missing_ok=True)
+
+    def campaigns(self):
+        """Ids of every campaign, in memory or on disk."""
+        with self._lock:
+            on_disk = {p.stem for p in self.campaign_dir.glob(f"*.{FILE_EXTENSION}")} if self.campaign_dir.exists() else set()
+            return sorted(on_disk | set(self._hot))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hot_campaigns': len(self._hot),
+                'hot_skeletons': sum(len(army) for hoard in self._hot.values() for army in hoard.values()),
+                'hits': self.hits,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_campaign_store():
+    """The store shared by every session in this process."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CampaignStore()
+            # Hoards still in memory when the server stops are kept too
+            atexit.register(_store.flush)
+        return _store
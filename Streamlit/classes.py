@@ -1,59 +1,153 @@
-import random
+import threading
+from dataclasses import dataclass
+import numpy as np
 import pandas as pd
 import streamlit as st
+from instrumentation import count, timed
+from undead import DAMAGE_MODIFIERS, get_profile
+from effects import EffectScheduler
+from stats import ArmyStats
+
+# last_action is stored as a small integer code, this maps the codes back to text
+LAST_ACTIONS = (
+    None,
+    "Hit!",
+    "Miss",
+    "Critical Hit!",
+    "Critical Miss",
+    "Successful Saving Throw",
+    "Failed Saving Throw",
+    "Critical Success!",
+    "Critical Failure",
+)
+ACTION_CODES = {action: code for code, action in enumerate(LAST_ACTIONS)}
+
+# Damage multiplier of each of undead.DAMAGE_MODIFIERS, in halves so
+# resistance can round down with integer division
+MODIFIER_CODES = {modifier: code for code, modifier in enumerate(DAMAGE_MODIFIERS)}
+_MODIFIER_SCALE = np.array([2, 1, 4, 0])
+
+# Columns each kind of roll changes, recorded for undo when a journal is attached
+ATTACK_FIELDS = ('last_roll', 'num_successes', 'num_fails', 'damage_done', 'last_action')
+SAVE_FIELDS = ('current_health', 'last_roll', 'num_successes', 'num_fails', 'last_action')
+
+# Per-skeleton columns kept by SkeletonArmy and their dtypes.
+# last_roll uses 0 for "not rolled yet" since a d20 never rolls 0.
+# damage_buff is the effective buff kept up to date by the army's
+# EffectScheduler; buff_duration is only read when importing old saves.
+COLUMNS = {
+    'id': np.int64,
+    'current_health': np.int32,
+    'max_health': np.int32,
+    'damage_buff': np.int32,
+    'buff_duration': np.int32,
+    'last_roll': np.int8,
+    'num_successes': np.int32,
+    'num_fails': np.int32,
+    'damage_done': np.int64,
+    'last_action': np.int8,
+    'alive': np.bool_,
+}
+
+def _column_property(name):
+    def getter(self):
+        return int(self._army._columns[name][self._army._index[self.id]])
+
+    def setter(self, value):
+        self._army._columns[name][self._army._index[self.id]] = value
+
+    return property(getter, setter)
+
+def _roll_dice(rng, count, sides, shape=()):
+    # A single die is drawn on its own so one-die attacks keep the random
+    # sequence they had before damage dice were configurable
+    if count == 1:
+        return rng.integers(1, sides + 1, size=shape)
+    return rng.integers(1, sides + 1, size=shape + (count,)).sum(axis=-1)
 
 class Skeleton:
+    """
+    A lightweight view of one row of a SkeletonArmy. All of the skeleton's
+    state lives in the army's columns, so creating one of these is cheap.
+    Attacks and saves come from the army's undead type (see undead.py),
+    so the same view serves zombies, ghouls and the rest.
+    """
+    __slots__ = ('_army', 'id')
+
     _id_counter = 1  # Start with 1 or set this in the set_starting_id method
-    
-    # Class attributes for attack details
-    sword_to_hit = 15
-    sword_damage = 11
-    bow_to_hit = 13
-    bow_damage = 5
-
-    # Adding ability score bonuses
-    ability_bonuses = {
-        'strength': +2,
-        'dexterity': +2,
-        'constitution': +2,
-        'intelligence': +2,
-        'wisdom': -1,
-        'charisma': -3
-    }
+    _id_lock = threading.Lock()  # armies in different threads share the counter
 
     @classmethod
     def set_starting_id(cls, starting_id):
         cls._id_counter = starting_id
 
-    def __init__(self, max_health, attack_bonus, dex_bonus):
-        if Skeleton._id_counter is None:
-            raise ValueError("Starting ID has not been set.")
-        self.id = Skeleton._id_counter
-        self.max_health = max_health
-        self.current_health = max_health
-        self.attack_bonus = attack_bonus
-        self.dex_bonus = dex_bonus
-        self.damage_buff = 0
-        self.buff_duration = 0
-        self.last_roll = None
-        self.num_successes = 0
-        self.num_fails= 0
-        self.last_action = None
-        self.damage_done = 0
-        Skeleton._id_counter += 1
+    @classmethod
+    def next_ids(cls, count):
+        if count < 0:
+            raise ValueError(f"Can't add {count} skeletons.")
+        with cls._id_lock:
+            if cls._id_counter is None:
+                raise ValueError("Starting ID has not been set.")
+            ids = np.arange(cls._id_counter, cls._id_counter + count, dtype=np.int64)
+            cls._id_counter += count
+        return ids
+
+    def __init__(self, army, skel_id):
+        self._army = army
+        self.id = skel_id
+
+    def __reduce__(self):
+        return (Skeleton, (self._army, self.id))
+
+    def __setstate__(self, state):
+        # Skeletons pickled before the columnar army were full objects. Keep
+        # their attributes around so SkeletonArmy.__setstate__ can import them.
+        self._army = state
+        self.id = state['id']
+
+    current_health = _column_property('current_health')
+    max_health = _column_property('max_health')
+    damage_buff = _column_property('damage_buff')
+    buff_duration = _column_property('buff_duration')
+    num_successes = _column_property('num_successes')
+    num_fails = _column_property('num_fails')
+    damage_done = _column_property('damage_done')
+
+    @property
+    def last_roll(self):
+        roll = self._army._columns['last_roll'][self._army._index[self.id]]
+        return int(roll) if roll else None
+
+    @last_roll.setter
+    def last_roll(self, value):
+        self._army._columns['last_roll'][self._army._index[self.id]] = value or 0
+
+    @property
+    def last_action(self):
+        return LAST_ACTIONS[self._army._columns['last_action'][self._army._index[self.id]]]
+
+    @last_action.setter
+    def last_action(self, value):
+        self._army._columns['last_action'][self._army._index[self.id]] = ACTION_CODES[value]
+
+    @property
+    def undead_type(self):
+        return self._army.undead_type
+
+    @property
+    def attack_bonus(self):
+        return self._army.attack_bonus
+
+    @property
+    def dex_bonus(self):
+        return self._army.dex_bonus
 
     def attack_roll(self, armor_class, attack_type='sword'):
-        # Choose the appropriate bonus and damage based on the attack type
-        if attack_type == 'sword':
-            bonus = Skeleton.sword_to_hit
-            damage = Skeleton.sword_damage + random.randint(1,6) + int(self.damage_buff)
-
-        elif attack_type == 'bow':
-            bonus = Skeleton.bow_to_hit
-            damage = Skeleton.bow_damage + random.randint(1,6) + int(self.damage_buff)
-        else:
-            raise ValueError(f"Unknown attack type: {attack_type}")
-        roll = random.randint(1, 20)
+        # Rolls come from the army's own stream so sessions can be replayed
+        rng = self._army.rng
+        bonus, base_damage, dice_count, dice_sides = self._army.profile.attack(attack_type)
+        damage = base_damage + int(_roll_dice(rng, dice_count, dice_sides)) + int(self.damage_buff)
+        roll = int(rng.integers(1, 21))
         critical_hit = roll == 20
         critical_miss = roll == 1
 
@@ -66,232 +160,619 @@ class Skeleton:
         else:
             hit = roll + bonus >= armor_class
 
-        self.buff_duration = max(0, self.buff_duration-1)
-        if(self.buff_duration==0):
-            self.damage_buff = 0
-
         return hit, damage, critical_hit, critical_miss,roll
 
     def saving_throw(self, dc, ability_type='dexterity'):
         # Fetch the correct bonus for the saving throw based on ability_type
-        bonus = self.ability_bonuses.get(ability_type, 0)
-        roll = random.randint(1, 20)
+        bonus = self._army.profile.saving_bonus(ability_type)
+        roll = int(self._army.rng.integers(1, 21))
         critical_success = roll == 20
         critical_failure = roll == 1
 
         # Automatic success on a natural 20 and automatic failure on a natural 1
         success = critical_success or (roll + bonus >= dc) if not critical_failure else False
         return success, roll, critical_success, critical_failure
-    
+
     def display_health(self):
-        return f"Skeleton {self.id}: Health = {self.current_health}/{self.max_health}"
-    
+        return f"{self.undead_type} {self.id}: Health = {self.current_health}/{self.max_health}"
+
+_rng = np.random.default_rng()
+
+def batch_attack_roll(damage_buffs, armor_class, attack_type='sword', rng=None, profile=None):
+    """
+    Vectorized version of Skeleton.attack_roll for a whole group of attackers.
+    Takes one damage buff per attacker and returns arrays of
+    (hit, damage, critical_hit, critical_miss, roll) with the same shape as
+    damage_buffs. profile is the attackers' UndeadProfile, skeletons by default.
+    """
+    rng = _rng if rng is None else rng
+    profile = get_profile('Skeleton') if profile is None else profile
+    bonus, base_damage, dice_count, dice_sides = profile.attack(attack_type)
+
+    damage_buffs = np.asarray(damage_buffs, dtype=np.int64)
+    shape = damage_buffs.shape
+    damage = base_damage + _roll_dice(rng, dice_count, dice_sides, shape) + damage_buffs
+    rolls = rng.integers(1, 21, size=shape)
+    critical_hit = rolls == 20
+    critical_miss = rolls == 1
+
+    # A natural 20 always hits for double damage, a natural 1 always misses
+    damage[critical_hit] *= 2
+    hit = critical_hit | (~critical_miss & (rolls + bonus >= armor_class))
+    return hit, damage, critical_hit, critical_miss, rolls
+
+def batch_saving_throw(count, dc, potential_damage, ability_type='dexterity', rng=None, profile=None):
+    """
+    Vectorized version of Skeleton.saving_throw for count skeletons.
+    Returns arrays of (success, damage, critical_success, critical_failure, roll)
+    where damage is full on a failure, halved on a success and 0 on a natural 20.
+    """
+    rng = _rng if rng is None else rng
+    profile = get_profile('Skeleton') if profile is None else profile
+    bonus = profile.saving_bonus(ability_type)
+    rolls = rng.integers(1, 21, size=count)
+    critical_success = rolls == 20
+    critical_failure = rolls == 1
+
+    # Automatic success on a natural 20 and automatic failure on a natural 1
+    success = critical_success | (~critical_failure & (rolls + bonus >= dc))
+    damage = np.where(success, potential_damage // 2, potential_damage)
+    damage[critical_success] = 0
+    return success, damage, critical_success, critical_failure, rolls
+
+@dataclass
+class AttackResult:
+    """
+    Outcome of SkeletonArmy.group_attack. Every array has one entry per
+    skeleton that attacked, in the same order as ids. damage is what each
+    skeleton dealt, 0 on a miss.
+    """
+    armor_class: int
+    attack_type: str
+    ids: np.ndarray
+    rolls: np.ndarray
+    hit: np.ndarray
+    critical_hit: np.ndarray
+    critical_miss: np.ndarray
+    damage: np.ndarray
+
+    @property
+    def num_hits(self):
+        return int(self.hit.sum())
+
+    @property
+    def total_damage(self):
+        return int(self.damage.sum())
+
+    @property
+    def hit_ids(self):
+        return self.ids[self.hit].tolist()
+
+    @property
+    def critical_hit_ids(self):
+        return self.ids[self.critical_hit].tolist()
+
+    @property
+    def critical_miss_ids(self):
+        return self.ids[self.critical_miss].tolist()
+
+@dataclass
+class SavingThrowResult:
+    """
+    Outcome of SkeletonArmy.group_saving_throw, one array entry per skeleton
+    that rolled. damage is the health each skeleton lost after its save,
+    so never more than it had.
+    """
+    dc: int
+    ability_type: str
+    ids: np.ndarray
+    rolls: np.ndarray
+    success: np.ndarray
+    critical_success: np.ndarray
+    critical_failure: np.ndarray
+    damage: np.ndarray
+    collapsed: np.ndarray
+
+    @property
+    def num_successes(self):
+        return int(self.success.sum())
+
+    @property
+    def total_damage(self):
+        return int(self.damage.sum())
+
+    @property
+    def success_ids(self):
+        return self.ids[self.success].tolist()
+
+    @property
+    def critical_success_ids(self):
+        return self.ids[self.critical_success].tolist()
+
+    @property
+    def critical_failure_ids(self):
+        return self.ids[self.critical_failure].tolist()
+
+    @property
+    def collapsed_ids(self):
+        return self.ids[self.collapsed].tolist()
+
 class SkeletonArmy:
-    def __init__(self, health, attack_bonus, dex_bonus):
-        self.skeletons = []
+    """
+    Stores the army column by column: one typed array per skeleton attribute
+    (see COLUMNS) plus an id -> row index. Removed skeletons are tombstoned
+    and the arrays are compacted once more than half the rows are dead, so
+    lookups and removals are O(1) and rows stay in the order they were raised.
+
+    If a journal (see journal.py) is attached, every mutating method records
+    the values it changed so the action can be undone and redone. If a
+    combat log (see combatlog.py) is attached, every group roll is logged.
+
+    Every roll the army makes comes from its own PCG64 generator. The seed
+    and generator state are saved with the army (see rng_state), so a
+    session can be replayed exactly.
+
+    All members of an army are the same undead_type, whose compiled stat
+    block (profile) decides their attacks and saves.
+
+    Damage buffs are round-based effects managed by self.effects (see
+    effects.py); call advance_round at the end of each combat round.
+    self.stats keeps running totals and d20 histograms of every group roll.
+    """
+    journal = None
+    combat_log = None
+    undead_type = 'Skeleton'  # armies pickled before undead types were skeletons
+
+    def __init__(self, health, attack_bonus, dex_bonus, seed=None, undead_type='Skeleton'):
         self.max_health = health
         self.attack_bonus = attack_bonus
         self.dex_bonus = dex_bonus
+        self.undead_type = undead_type
+        self._reset_columns()
+        self.seed_rng(seed)
+        self.effects = EffectScheduler(self)
+        self.stats = ArmyStats()
 
-    def add_skeletons(self, count):
-        for _ in range(count):
-            new_skeleton = Skeleton(self.max_health, self.attack_bonus, self.dex_bonus)
-            self.skeletons.append(new_skeleton)
-        print(f"Total number of skeletons: {len(self.skeletons)}.")
+    @classmethod
+    def from_undead_type(cls, undead_type, seed=None):
+        """An empty army using the health and bonuses of a registered stat block."""
+        profile = get_profile(undead_type)
+        return cls(profile.max_health, profile.attack_bonus, profile.dex_bonus, seed, undead_type)
+
+    @property
+    def profile(self):
+        return get_profile(self.undead_type)
+
+    def seed_rng(self, seed=None, spawned=0):
+        """
+        Start a new random stream. With no seed fresh entropy is used, and
+        the seed it picked is kept in self.seed either way.
+        """
+        seed_seq = np.random.SeedSequence(seed, n_children_spawned=spawned)
+        self.seed = seed_seq.entropy
+        self._seed_seq = seed_seq
+        self.rng = np.random.Generator(np.random.PCG64(seed_seq))
+
+    def spawn_seeds(self, count):
+        """Independent child seeds, e.g. one per worker of a parallel simulation."""
+        return self._seed_seq.spawn(count)
+
+    def rng_state(self):
+        return {
+            'seed': self.seed,
+            'spawned': self._seed_seq.n_children_spawned,
+            'state': self.rng.bit_generator.state,
+        }
+
+    def set_rng_state(self, state):
+        self.seed_rng(state['seed'], state['spawned'])
+        self.rng.bit_generator.state = state['state']
+
+    def _reset_columns(self):
+        self._columns = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._index = {}
+        self._size = 0
+        self._dead = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_columns'] = {name: col[:self._size].copy() for name, col in self._columns.items()}
+        state.pop('journal', None)
+        state.pop('combat_log', None)
+        return state
+
+    def __setstate__(self, state):
+        # Armies pickled before the columnar layout held Skeleton objects,
+        # first as a list and later as an id -> Skeleton dict
+        legacy = state.pop('skeletons', None)
+        if legacy is None and '_skeletons' in state:
+            legacy = list(state.pop('_skeletons').values())
+        self.__dict__.update(state)
+        if 'rng' not in state:
+            self.seed_rng()
+        if legacy is not None:
+            self._reset_columns()
+            self._import_rows([s._army for s in legacy])
+        if 'effects' not in state:
+            self.effects = EffectScheduler(self)
+            self.effects.import_legacy_buffs()
+        if 'stats' not in state:
+            self.stats = ArmyStats()
+
+    def export_columns(self):
+        """The live skeletons' columns (without the tombstone mask), in roster order."""
+        if self._dead:
+            self._compact()
+        return {name: col[:self._size] for name, col in self._columns.items() if name != 'alive'}
+
+    @classmethod
+    def from_columns(cls, health, attack_bonus, dex_bonus, columns, seed=None, undead_type='Skeleton'):
+        """Build an army from arrays like the ones export_columns returns."""
+        army = cls(health, attack_bonus, dex_bonus, seed, undead_type)
+        army._load_columns(columns)
+        return army
+
+    def _load_columns(self, columns):
+        self._reset_columns()
+        self._append_rows(np.asarray(columns['id'], dtype=np.int64), self.max_health)
+        for name, values in columns.items():
+            if name in COLUMNS and name not in ('id', 'alive'):
+                self._columns[name][:self._size] = values
+
+    def _import_rows(self, rows):
+        # rows are dicts of skeleton attributes, e.g. from an old pickle
+        start = self._append_rows(np.array([r['id'] for r in rows], dtype=np.int64), self.max_health)
+        cols = self._columns
+        for i, r in enumerate(rows, start):
+            cols['current_health'][i] = r['current_health']
+            cols['max_health'][i] = r['max_health']
+            cols['damage_buff'][i] = r.get('damage_buff', 0)
+            cols['buff_duration'][i] = r.get('buff_duration', 0)
+            cols['last_roll'][i] = r.get('last_roll') or 0
+            cols['num_successes'][i] = r.get('num_successes', 0)
+            cols['num_fails'][i] = r.get('num_fails', 0)
+            cols['damage_done'][i] = r.get('damage_done', 0)
+            cols['last_action'][i] = ACTION_CODES.get(r.get('last_action'), 0)
+
+    def _append_rows(self, ids, max_health):
+        count = ids.size
+        start = self._size
+        needed = start + count
+        capacity = self._columns['id'].size
+        if needed > capacity:
+            capacity = max(needed, 2 * capacity, 16)
+            for name, col in self._columns.items():
+                grown = np.zeros(capacity, dtype=col.dtype)
+                grown[:start] = col[:start]
+                self._columns[name] = grown
+
+        cols = self._columns
+        cols['id'][start:needed] = ids
+        cols['current_health'][start:needed] = max_health
+        cols['max_health'][start:needed] = max_health
+        cols['alive'][start:needed] = True
+        self._index.update(zip(ids.tolist(), range(start, needed)))
+        self._size = needed
+        return start
+
+    def _kill(self, rows):
+        # Tombstone the rows and drop them from the index
+        if len(rows) == 0:
+            return
+        self._columns['alive'][rows] = False
+        for skel_id in self._columns['id'][rows].tolist():
+            del self._index[skel_id]
+        self._dead += len(rows)
+        if self._dead * 2 > self._size:
+            self._compact()
+
+    def _compact(self):
+        keep = self._columns['alive'][:self._size]
+        n = int(keep.sum())
+        for col in self._columns.values():
+            col[:n] = col[:self._size][keep]
+            col[n:self._size] = 0
+        self._size = n
+        self._dead = 0
+        self._index = dict(zip(self._columns['id'][:n].tolist(), range(n)))
+
+    def _sort_by_id(self):
+        self._compact()
+        n = self._size
+        order = np.argsort(self._columns['id'][:n], kind='stable')
+        for col in self._columns.values():
+            col[:n] = col[:n][order]
+        self._index = dict(zip(self._columns['id'][:n].tolist(), range(n)))
+
+    def _row_values(self, rows):
+        if rows is None or len(rows) == 0:
+            return None
+        return {name: col[rows].copy() for name, col in self._columns.items() if name != 'alive'}
+
+    def _insert_rows(self, values):
+        # Put back whole rows, e.g. skeletons revived by undo, keeping id order
+        last_id = self._columns['id'][self._size - 1] if self._size else None
+        start = self._append_rows(values['id'], 0)
+        for name, col in values.items():
+            self._columns[name][start:self._size] = col
+        if last_id is not None and values['id'].min() < last_id:
+            self._sort_by_id()
+
+    def _write_values(self, skeleton_ids, values):
+        rows = self._rows(skeleton_ids.tolist())
+        for name, col in values.items():
+            self._columns[name][rows] = col
+
+    def _begin(self, rows, fields=()):
+        # Remember the values about to change so the journal can undo them
+        if self.journal is None:
+            return None
+        cols = self._columns
+        return {
+            'ids': cols['id'][rows].copy(),
+            'before': {f: cols[f][rows].copy() for f in fields},
+            'rng_before': self.rng.bit_generator.state,
+            'effects_before': self.effects.state(),
+        }
+
+    def _commit(self, change, action, rows, removed_rows=None, added_rows=None):
+        # Finishes a mutating action: records it if there is a journal, then
+        # removes removed_rows from the army. rows may move after this.
+        if change is not None:
+            cols = self._columns
+            change['action'] = action
+            change['after'] = {f: cols[f][rows].copy() for f in change['before']}
+            change['rng_after'] = self.rng.bit_generator.state
+            change['effects_after'] = self.effects.state()
+            change['removed'] = self._row_values(removed_rows)
+            change['added'] = self._row_values(added_rows)
+        if removed_rows is not None:
+            self._kill(removed_rows)
+        if change is not None:
+            self.journal.record(change)
+
+    def _rows(self, skeleton_ids):
+        # Row of each requested id, dropping unknown and repeated ids
+        index = self._index
+        return np.array([index[i] for i in dict.fromkeys(skeleton_ids) if i in index], dtype=np.intp)
+
+    def _alive_rows(self):
+        return np.flatnonzero(self._columns['alive'][:self._size])
+
+    @property
+    def skeletons(self):
+        return [Skeleton(self, skel_id) for skel_id in self._index]
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, skel_id):
+        return skel_id in self._index
+
+    def ids(self):
+        """Ids of the living skeletons, as a new array."""
+        return self._columns['id'][self._alive_rows()]
+
+    def get_skeleton(self, skel_id):
+        if skel_id in self._index:
+            return Skeleton(self, skel_id)
+        return None
+
+    @timed('army.add_skeletons')
+    def add_skeletons(self, number):
+        no_rows = np.zeros(0, dtype=np.intp)
+        change = self._begin(no_rows)
+        start = self._append_rows(Skeleton.next_ids(number), self.max_health)
+        self._commit(change, 'add', no_rows, added_rows=np.arange(start, self._size))
+        print(f"Total number of skeletons: {len(self)}.")
 
     def display_army_for_removal(self):
-        if not self.skeletons:
+        if not self._index:
             print("No skeletons in the army.")
             return
         print("Skeletons available for removal:")
         for skeleton in self.skeletons:
             print(skeleton.display_health())
 
+    @timed('army.remove_skeletons')
     def remove_skeletons(self, skeleton_ids):
         collapsed_skeletons_ids = []
         for skel_id in skeleton_ids:
-            skeleton = next((s for s in self.skeletons if s.id == skel_id), None)
-            if skeleton:
-                self.skeletons.remove(skeleton)
+            if skel_id in self._index:
                 collapsed_skeletons_ids.append(skel_id)
                 print(f"Skeleton {skel_id} has been removed.")
             else:
                 print(f"No skeleton with ID {skel_id} found.")
+
+        rows = self._rows(collapsed_skeletons_ids)
+        no_rows = np.zeros(0, dtype=np.intp)
+        self._commit(self._begin(no_rows), 'remove', no_rows, removed_rows=rows)
         if collapsed_skeletons_ids:
             print(f"Removed skeletons with IDs: {collapsed_skeletons_ids}")
         else:
             print("No skeletons were removed.")
 
-        # Display the health of the remaining skeletons
-        self.display_army_health()
-
+    @timed('army.group_attack')
     def group_attack(self, attacking_skeleton_ids, armor_class, attack_type='sword'):
-        total_damage = 0
-        hits = []
-        num_hits = 0
-        num_crit_hits = 0
-        num_crit_fails = 0
-
-        for skel_id in attacking_skeleton_ids:
-            skeleton = next((s for s in self.skeletons if s.id == skel_id), None)
-            if skeleton:
-                hit, damage, critical_hit, critical_miss,roll = skeleton.attack_roll(armor_class, attack_type)
-                skeleton.last_roll = roll
-
-                if critical_hit:
-                    total_damage += damage
-                    st.write(f"Skeleton {skeleton.id} critically hit for {damage} damage.")
-                    hits.append(skel_id)
-                    num_hits+=1
-                    num_crit_hits+=1
-                    skeleton.last_action = "Critical Hit!"
-                    skeleton.num_successes += 1
-                    skeleton.damage_done += damage
-
-
-
-                elif critical_miss:
-                    st.write(f"Skeleton {skeleton.id} critically missed.")
-                    skeleton.last_action = "Critical Miss"
-                    skeleton.num_fails += 1
-
-
-                elif hit:
-                    hits.append(skel_id)
-                    total_damage += damage
-                    num_hits += 1
-                    num_crit_fails += 1
-                    skeleton.num_successes += 1
-                    skeleton.last_action = "Hit!"
-                    skeleton.damage_done += damage
-
-                else: 
-                    skeleton.num_fails += 1
-                    skeleton.last_action = "Miss"
-
-
-
-            # else:
-            #     st.write(f"No skeleton with ID {skel_id} found.")
-
-        # Summarize which skeletons hit
-        if hits:
-            st.write(f"Skeletons {', '.join(map(str, hits))} hit.")
-        st.write(f"{num_hits} skeletons hit for {total_damage} total damage")
-    
+        cols = self._columns
+        rows = self._rows(attacking_skeleton_ids)
+        change = self._begin(rows, ATTACK_FIELDS)
+        count('army.attack_rolls', rows.size)
+        # damage_buff already holds each skeleton's effective buff
+        hit, damage, critical_hit, critical_miss, rolls = batch_attack_roll(
+            cols['damage_buff'][rows], armor_class, attack_type, rng=self.rng, profile=self.profile)
+
+        cols['last_roll'][rows] = rolls
+        cols['num_successes'][rows[hit]] += 1
+        cols['num_fails'][rows[~hit]] += 1
+        cols['damage_done'][rows[hit]] += damage[hit]
+        action = np.where(hit, ACTION_CODES["Hit!"], ACTION_CODES["Miss"])
+        action[critical_hit] = ACTION_CODES["Critical Hit!"]
+        action[critical_miss] = ACTION_CODES["Critical Miss"]
+        cols['last_action'][rows] = action
+        self._commit(change, 'attack', rows)
+
+        result = AttackResult(armor_class, attack_type, cols['id'][rows], rolls, hit,
+                              critical_hit, critical_miss, np.where(hit, damage, 0))
+        self.stats.record_attack(result, self.effects.round)
+        if self.combat_log is not None:
+            self.combat_log.attack(self, result)
+        return result
+
+    @timed('army.group_saving_throw')
     def group_saving_throw(self, affected_skeleton_ids, dc, potential_damage, ability_type='dexterity'):
-        successes = []
-
-        num_successes = 0
-        num_crit_success = 0
-        num_crit_fails = 0
-        
-        for skel_id in affected_skeleton_ids:
-            skeleton = next((s for s in self.skeletons if s.id == skel_id), None)
-            if skeleton:
-                success, roll, critical_success, critical_failure = skeleton.saving_throw(dc, ability_type)
-                skeleton.last_roll = roll
-
-                if critical_success:
-                    st.write(f"Skeleton {skeleton.id} rolled a 20. Critical success on the saving throw.")
-                    damage = 0
-
-                    successes.append(skel_id)
-                    num_crit_success +=1
-                    num_successes+=1
-
-                    skeleton.last_action = "Critical Success!"
-                    skeleton.num_successes += 1
-
-                elif critical_failure:
-                    st.write(f"Skeleton {skeleton.id} rolled a 1. Critical failure on the saving throw.")
-                    damage = potential_damage
-                    
-                    num_crit_fails += 1
-                    skeleton.num_fails += 1
-
-                    skeleton.last_action = "Critical Failure"
-
-
-                elif success:
-                    successes.append(skel_id)
-
-                    damage = potential_damage // 2
-                    num_successes+=1
-
-                    skeleton.last_action = "Successful Saving Throw"
-
-                    skeleton.num_successes += 1
-
-
-                else:
-                    damage = potential_damage
-                    skeleton.num_fails += 1
-                    skeleton.last_action = "Failed Saving Throw"
-
-
-                skeleton.current_health -= damage
-                skeleton.current_health = max(skeleton.current_health, 0)
-
-                if skeleton.current_health == 0:
-                    st.write(f"Skeleton {skeleton.id} has collapsed.")
-
+        cols = self._columns
+        rows = self._rows(affected_skeleton_ids)
+        change = self._begin(rows, SAVE_FIELDS)
+        count('army.saving_throw_rolls', rows.size)
+        success, damage, critical_success, critical_failure, rolls = batch_saving_throw(
+            rows.size, dc, potential_damage, ability_type, rng=self.rng, profile=self.profile)
+
+        old_health = cols['current_health'][rows]
+        health = np.maximum(old_health - damage, 0)
+        cols['current_health'][rows] = health
+        collapsed = health == 0
+        # Damage past 0 health isn't taken
+        damage = old_health - health
+
+        cols['last_roll'][rows] = rolls
+        cols['num_successes'][rows[success]] += 1
+        cols['num_fails'][rows[~success]] += 1
+        action = np.where(success, ACTION_CODES["Successful Saving Throw"], ACTION_CODES["Failed Saving Throw"])
+        action[critical_success] = ACTION_CODES["Critical Success!"]
+        action[critical_failure] = ACTION_CODES["Critical Failure"]
+        cols['last_action'][rows] = action
+        result = SavingThrowResult(dc, ability_type, cols['id'][rows], rolls, success,
+                                   critical_success, critical_failure, damage, collapsed)
+
+        # Only the skeletons that just hit 0 need to leave the army
+        self._commit(change, 'saving throw', rows, removed_rows=rows[collapsed])
+        self.stats.record_saving_throw(result)
+        if self.combat_log is not None:
+            self.combat_log.saving_throw(self, result)
+        return result
+
+    @timed('army.apply_health')
+    def apply_health(self, skeleton_ids, amounts, modifiers=None, damage_type=None):
+        """
+        Damage (positive amounts) or heal (negative amounts) many skeletons
+        in one pass. amounts and modifiers are either one value per id or a
+        single value for all of them; an id listed twice takes both amounts.
+
+        modifiers are 'normal', 'resistant' (half damage, rounded down),
+        'vulnerable' (double) or 'immune', applied to damage only. By default
+        they come from the stat block's entry for damage_type.
+
+        Health is kept between 0 and max health. Skeletons that reach 0
+        collapse and leave the army; their ids are returned.
+        """
+        cols = self._columns
+        index = self._index
+        ids = np.atleast_1d(np.asarray(skeleton_ids, dtype=np.int64))
+        amounts = np.broadcast_to(np.asarray(amounts, dtype=np.int64), ids.shape)
+        if modifiers is None:
+            modifiers = self.profile.damage_modifier(damage_type)
+        try:
+            if isinstance(modifiers, str):
+                codes = MODIFIER_CODES[modifiers]
             else:
-                print(f"No skeleton with ID {skel_id} found.")
-        
-        # Summarize which skeletons succeeded
-        if successes:
-            st.write(f"Skeletons {', '.join(map(str, successes))} succeeded.")
-
-        self.skeletons = [skeleton for skeleton in self.skeletons if skeleton.current_health > 0]
-        self.display_army_health()
+                codes = np.array([MODIFIER_CODES[m] for m in modifiers], dtype=np.intp)
+        except KeyError:
+            raise ValueError(f"Damage modifiers must be one of {', '.join(DAMAGE_MODIFIERS)}.") from None
+        codes = np.broadcast_to(codes, ids.shape)
+
+        # Resistance and friends only change damage, never healing
+        damage = np.where(amounts > 0, _MODIFIER_SCALE[codes] * amounts // 2, amounts)
+
+        # Unknown (already collapsed) ids are skipped, repeated ids add up
+        positions = np.fromiter((index.get(i, -1) for i in ids.tolist()), dtype=np.intp, count=ids.size)
+        known = positions >= 0
+        rows, inverse = np.unique(positions[known], return_inverse=True)
+        totals = np.bincount(inverse, weights=damage[known], minlength=rows.size).astype(np.int64)
+
+        change = self._begin(rows, ('current_health',))
+        health = np.clip(cols['current_health'][rows] - totals, 0, cols['max_health'][rows])
+        cols['current_health'][rows] = health
+        collapsed = rows[health == 0]
+        collapsed_ids = cols['id'][collapsed].copy()
+        self._commit(change, 'update health', rows, removed_rows=collapsed)
+        return collapsed_ids
 
     def update_health(self, updates):
-        collapsed_skeletons = []
-        for skeleton_id, damage in updates.items():
-            # Find the skeleton with the matching ID
-            skeleton = next((skel for skel in self.skeletons if skel.id == skeleton_id), None)
-            if skeleton:
-                skeleton.current_health -= damage
-                if skeleton.current_health <= 0:
-                    collapsed_skeletons.append(skeleton)
-        
-        # Remove collapsed skeletons and print a message for each
-        for skeleton in collapsed_skeletons:
-            self.skeletons.remove(skeleton)
-            print(f"Skeleton {skeleton.id} has collapsed.")
-
-        # Display the health of the remaining skeletons
-        self.display_army_health()
-
-    def add_damage_buff(self,buff,duration):
+        """Apply {id: damage} updates, negative damage heals."""
+        collapsed = self.apply_health(list(updates.keys()), list(updates.values()))
+        # Print a message for each collapsed skeleton
+        for skel_id in collapsed:
+            print(f"Skeleton {skel_id} has collapsed.")
+
+    @timed('army.add_damage_buff')
+    def add_damage_buff(self, buff, duration, name='buff', stacking='stack', skeleton_ids=None):
+        """
+        Buff the army (or skeleton_ids) for duration rounds. Buffs with the
+        same name combine by their stacking rule, see effects.py.
+        """
         if ((buff!='') and (duration != '')):
-            for skeleton in self.skeletons:
-                skeleton.damage_buff += int(buff)
-                skeleton.buff_duration = int(duration)
+            # A replaced buff may cover other skeletons, so record every row
+            rows = self._alive_rows()
+            change = self._begin(rows, ('damage_buff',))
+            self.effects.add(int(buff), int(duration), name, stacking, skeleton_ids)
+            self._commit(change, 'buff', rows)
 
+    @timed('army.reset_buff')
     def reset_buff(self):
-        for skeleton in self.skeletons:
-            skeleton.damage_buff = 0
+        rows = self._alive_rows()
+        change = self._begin(rows, ('damage_buff',))
+        self.effects.clear()
+        self._commit(change, 'reset buff', rows)
+
+    @timed('army.advance_round')
+    def advance_round(self, rounds=1):
+        """End the round: effects that run out are removed in one pass."""
+        rows = self._rows(self.effects.due_ids(self.effects.round + rounds).tolist())
+        change = self._begin(rows, ('damage_buff',))
+        expired = self.effects.advance(rounds)
+        self._commit(change, 'next round', rows)
+        return expired
 
     def add_skeleton(self):
-        self.skeletons.append(Skeleton(self.health, self.attack_bonus, self.dex_bonus))
-        print(f"One skeleton added. Total number of skeletons: {len(self.skeletons)}.")
+        self.add_skeletons(1)
 
     def remove_skeleton(self):
-        if self.skeletons:
-            self.skeletons.pop()
-            print(f"One skeleton removed. Total number of skeletons: {len(self.skeletons)}.")
+        if self._index:
+            rows = self._alive_rows()[-1:]
+            no_rows = np.zeros(0, dtype=np.intp)
+            self._commit(self._begin(no_rows), 'remove', no_rows, removed_rows=rows)
+            print(f"One skeleton removed. Total number of skeletons: {len(self)}.")
         else:
             print("No skeletons to remove.")
-            
+
     def display_army_health(self):
-        if not self.skeletons:
+        if not self._index:
             st.write("No skeletons in the army.")
             return
-        print("Current health of the Skeleton Army:")
+        print(f"Current health of the {self.undead_type} Army:")
         for skeleton in self.skeletons:
             st.write(skeleton.display_health())
-    
+
     def get_skeletons(self):
         return self.skeletons
+
+    @timed('army.to_dataframe')
+    def to_dataframe(self):
+        """The whole roster as one DataFrame, built straight from the columns."""
+        cols = self._columns
+        rows = self._alive_rows()
+        successes = cols['num_successes'][rows]
+        attempts = successes + cols['num_fails'][rows]
+        last_roll = cols['last_roll'][rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            hit_rate = np.where(attempts > 0, successes / attempts, np.nan)
+        return pd.DataFrame({
+            'ID': cols['id'][rows],
+            'Health': cols['current_health'][rows],
+            'Max Health': cols['max_health'][rows],
+            'Last Roll': pd.arrays.IntegerArray(last_roll.astype(np.int64), last_roll == 0),
+            'Last Action': np.array(LAST_ACTIONS, dtype=object)[cols['last_action'][rows]],
+            'Damage Done': cols['damage_done'][rows],
+            'Hit Rate': hit_rate,
+        })
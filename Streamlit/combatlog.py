@@ -0,0 +1,157 @@
+"""
+Append-only record of every roll an army resolves.
+
+An army with a CombatLog attached (like a journal, see SkeletonArmy)
+sends each group_attack and group_saving_throw result to it. The log keeps
+a short summary of the last few entries in memory for display, and hands
+the full result, one value per skeleton, to a LogWriter.
+
+A LogWriter owns one JSONL file and a background thread. Entries are only
+queued on the caller's side; the thread turns them into JSON, appends them
+in batches, and rotates the file once it would grow past max_bytes
+(combat.jsonl -> combat.jsonl.1 -> ... -> combat.jsonl.<backups>, the
+oldest being dropped). So a long session uses constant memory and its
+clicks never wait on the disk.
+"""
+import atexit
+import dataclasses
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from pathlib import Path
+import numpy as np
+
+COMBAT_LOG_PATH = Path(os.environ.get('NECRO_COMBAT_LOG', Path(__file__).resolve().parent.parent / 'logs' / 'combat.jsonl'))
+
+_STOP = object()
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Can't log {type(value).__name__}")
+
+class LogWriter:
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=5):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.written = 0
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name=f"combat log {self.path.name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, summary, result):
+        self._queue.put((summary, result))
+
+    def flush(self):
+        """Wait until everything written so far is on disk."""
+        if self._thread.is_alive():
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            # Take everything queued since the last pass and write it at once
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stop = False
+            for item in items:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    self._append(lines)
+                    lines = []
+                    item.set()
+                else:
+                    summary, result = item
+                    entry = {**summary, **dataclasses.asdict(result)}
+                    lines.append(json.dumps(entry, default=_jsonable) + '\n')
+            self._append(lines)
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                return
+
+    def _append(self, lines):
+        for line in lines:
+            data = line.encode('utf-8')
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'ab')
+            if self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self.written += 1
+        if lines:
+            self._file.flush()
+
+    def _rotate(self):
+        self._file.close()
+        for n in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{n}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{n + 1}"))
+        if self.backups:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = open(self.path, 'ab')
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_log_writer(path=COMBAT_LOG_PATH):
+    """One writer per file for the whole process, so entries never interleave."""
+    path = Path(path).resolve()
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = LogWriter(path)
+        return writer
+
+class CombatLog:
+    def __init__(self, writer=None, tail=100):
+        self.writer = get_log_writer() if writer is None else writer
+        self._tail = deque(maxlen=tail)
+
+    def tail(self):
+        """The most recent entries' summaries, oldest first."""
+        return list(self._tail)
+
+    def _record(self, army, kind, result, summary):
+        entry = {'time': time.time(), 'kind': kind, 'undead_type': army.undead_type,
+                 'round': army.effects.round, 'count': int(result.ids.size), **summary}
+        self._tail.append(entry)
+        self.writer.write(entry, result)
+
+    def attack(self, army, result):
+        self._record(army, 'attack', result, {
+            'successes': int(result.hit.sum()),
+            'criticals': int(result.critical_hit.sum()),
+            'total_damage': int(result.damage.sum()),
+        })
+
+    def saving_throw(self, army, result):
+        self._record(army, 'saving throw', result, {
+            'successes': int(result.success.sum()),
+            'criticals': int(result.critical_success.sum()),
+            'total_damage': int(result.damage.sum()),
+        })
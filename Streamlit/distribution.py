@@ -0,0 +1,114 @@
+import numpy as np
+from collections import Counter
+from functools import lru_cache
+from odds import attack_odds
+from undead import get_profile
+
+DAMAGE_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Above this many multiply-adds a convolution is done with an FFT instead
+DIRECT_CONVOLVE_LIMIT = 1_000_000
+
+# Every function here takes the attackers' UndeadProfile last, skeletons by default
+
+def _attack_stats(attack_type, profile):
+    profile = get_profile('Skeleton') if profile is None else profile
+    return profile.attack(attack_type)
+
+def hit_chances(armor_class, attack_type='sword', profile=None):
+    """
+    Chance that one attack is a normal hit and that it is a critical hit,
+    following the rules in Skeleton.attack_roll.
+    """
+    odds = attack_odds(armor_class, attack_type, 0, profile)
+    return odds.p_hit, odds.p_crit
+
+@lru_cache(maxsize=256)
+def attack_pmf(armor_class, attack_type='sword', damage_buff=0, profile=None):
+    """
+    Exact damage distribution of a single attack. Entry i of the returned
+    (read-only) array is the probability of dealing exactly i damage.
+    """
+    _, base_damage, dice_count, dice_sides = _attack_stats(attack_type, profile)
+    p_hit, p_crit = hit_chances(armor_class, attack_type, profile)
+    low = base_damage + damage_buff + dice_count
+    if low < 0:
+        raise ValueError("Damage buff makes negative damage possible.")
+
+    # Damage is base + dice + buff, and all of it is doubled on a crit
+    dice = convolve_power(np.full(dice_sides, 1 / dice_sides), dice_count)
+    totals = low + np.arange(dice.size)
+    pmf = np.zeros(2 * totals[-1] + 1)
+    pmf[0] = 1 - p_hit - p_crit
+    pmf[totals] += p_hit * dice
+    pmf[2 * totals] += p_crit * dice
+    pmf.flags.writeable = False
+    return pmf
+
+def _convolve(a, b):
+    if a.size * b.size <= DIRECT_CONVOLVE_LIMIT:
+        return np.convolve(a, b)
+    n = a.size + b.size - 1
+    out = np.fft.irfft(np.fft.rfft(a, n) * np.fft.rfft(b, n), n)
+    # Clear the rounding noise the FFT leaves in the far tails
+    return np.clip(out, 0, None)
+
+def convolve_power(pmf, n):
+    """Distribution of the sum of n independent draws from pmf."""
+    result = np.ones(1)
+    base = np.asarray(pmf, dtype=float)
+    # Exponentiation by squaring: O(log n) convolutions instead of n
+    while n:
+        if n & 1:
+            result = _convolve(result, base)
+        n >>= 1
+        if n:
+            base = _convolve(base, base)
+    return result
+
+def damage_pmf(damage_buffs, armor_class, attack_type='sword', profile=None):
+    """
+    Exact distribution of the total damage of one group_attack volley, with
+    one entry in damage_buffs per attacking skeleton.
+    """
+    total = np.ones(1)
+    # Skeletons with the same buff share a distribution, so each distinct
+    # buff only needs one convolution power
+    for damage_buff, count in sorted(Counter(int(b) for b in damage_buffs).items()):
+        total = _convolve(total, convolve_power(attack_pmf(armor_class, attack_type, damage_buff, profile), count))
+    return total / total.sum()
+
+def hits_pmf(num_attackers, armor_class, attack_type='sword', profile=None):
+    """Exact distribution of the number of skeletons that hit."""
+    p_hit, p_crit = hit_chances(armor_class, attack_type, profile)
+    p = p_hit + p_crit
+    return convolve_power(np.array([1 - p, p]), num_attackers)
+
+def probability_at_least(pmf, threshold):
+    """Chance that a value drawn from pmf is at least threshold."""
+    threshold = max(int(threshold), 0)
+    return float(np.sum(pmf[threshold:]))
+
+def exact_attack_odds(damage_buffs, armor_class, attack_type='sword', target_health=None, profile=None):
+    """
+    Exact counterpart of simulator.simulate_attacks, returning the same keys
+    plus the full damage PMF and CDF.
+    """
+    damage_buffs = list(damage_buffs)
+    pmf = damage_pmf(damage_buffs, armor_class, attack_type, profile)
+    mean_damage = sum(count * attack_odds(armor_class, attack_type, damage_buff, profile).expected_damage
+                      for damage_buff, count in Counter(int(b) for b in damage_buffs).items())
+    cdf = np.cumsum(pmf)
+    percentiles = np.searchsorted(cdf, np.array(DAMAGE_PERCENTILES) / 100 - 1e-12)
+
+    results = {
+        'mean_damage': float(mean_damage),
+        'damage_percentiles': dict(zip(DAMAGE_PERCENTILES, percentiles.astype(float).tolist())),
+        'hit_distribution': hits_pmf(len(damage_buffs), armor_class, attack_type, profile),
+        'kill_probability': None,
+        'damage_pmf': pmf,
+        'damage_cdf': cdf,
+    }
+    if target_health is not None:
+        results['kill_probability'] = probability_at_least(pmf, target_health)
+    return results
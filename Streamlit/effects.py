@@ -0,0 +1,206 @@
+"""
+Round-based effects (damage buffs) on an army.
+
+Each army owns an EffectScheduler. Effects last a number of rounds, not
+attacks, and sit in a heap keyed by the round they expire at, so
+advancing the round pops exactly the effects that are due in one pass.
+
+The army's damage_buff column always holds each skeleton's effective
+buff. Adding or expiring an effect only changes the rows it covers, by
+the difference it makes, so rolling never has to look at effects at all.
+
+Effects with the same name form a group whose stacking rule decides how
+they combine:
+    'stack'    amounts add up
+    'max'      only the biggest counts
+    'replace'  a new effect ends the old ones
+"""
+import heapq
+from dataclasses import dataclass
+import numpy as np
+
+STACKING_RULES = ('stack', 'max', 'replace')
+
+@dataclass(eq=False)
+class Effect:
+    name: str
+    damage_buff: int
+    expires: int  # round the effect ends at, None if it never does
+    stacking: str
+    ids: np.ndarray  # skeletons it applies to
+    seq: int = 0
+    active: bool = True
+
+    def to_dict(self):
+        return {'name': self.name, 'damage_buff': self.damage_buff, 'expires': self.expires,
+                'stacking': self.stacking, 'ids': self.ids.tolist(), 'seq': self.seq}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data['damage_buff'], data['expires'], data['stacking'],
+                   np.asarray(data['ids'], dtype=np.int64), data['seq'])
+
+def _group_buffs(effects):
+    # Combined buff of one named group: (ids, amount per id)
+    if not effects:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    ids = np.concatenate([e.ids for e in effects])
+    amounts = np.concatenate([np.full(e.ids.size, e.damage_buff, dtype=np.int64) for e in effects])
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    if effects[-1].stacking == 'max':
+        combined = np.full(unique_ids.size, np.iinfo(np.int64).min)
+        np.maximum.at(combined, inverse, amounts)
+    else:
+        combined = np.bincount(inverse, weights=amounts, minlength=unique_ids.size).astype(np.int64)
+    return unique_ids, combined
+
+class EffectScheduler:
+    def __init__(self, army):
+        self.army = army
+        self.round = 0
+        self._seq = 0
+        self._heap = []  # (expires, seq, effect), replaced effects are skipped when popped
+        self._groups = {}  # name -> active effects, oldest first
+
+    def __len__(self):
+        return sum(len(group) for group in self._groups.values())
+
+    def active_effects(self):
+        return sorted((e for group in self._groups.values() for e in group), key=lambda e: e.seq)
+
+    def rounds_left(self, effect):
+        return None if effect.expires is None else effect.expires - self.round
+
+    def _apply_delta(self, before, after):
+        # Move damage_buff from one combined group buff to another
+        army = self.army
+        col = army._columns['damage_buff']
+        for (ids, amounts), sign in ((before, -1), (after, 1)):
+            if ids.size:
+                known = np.fromiter((i in army._index for i in ids.tolist()), dtype=bool, count=ids.size)
+                rows = army._rows(ids[known].tolist())
+                col[rows] += sign * amounts[known]
+
+    def _set_group(self, name, effects):
+        before = _group_buffs(self._groups.get(name, []))
+        if effects:
+            self._groups[name] = effects
+        else:
+            self._groups.pop(name, None)
+        self._apply_delta(before, _group_buffs(effects))
+
+    def add(self, damage_buff, duration=None, name='buff', stacking='stack', skeleton_ids=None):
+        """
+        Give damage_buff to skeleton_ids (the whole army by default) for
+        duration rounds, or until cleared if duration is None.
+        """
+        if stacking not in STACKING_RULES:
+            raise ValueError(f"Unknown stacking rule: {stacking}")
+        army = self.army
+        if skeleton_ids is None:
+            ids = army.ids()
+        else:
+            ids = army._columns['id'][army._rows(skeleton_ids)].copy()
+        expires = None if duration is None else self.round + int(duration)
+        self._seq += 1
+        effect = Effect(name, int(damage_buff), expires, stacking, ids, self._seq)
+
+        group = self._groups.get(name, [])
+        if stacking == 'replace':
+            for old in group:
+                old.active = False
+            group = []
+        self._set_group(name, group + [effect])
+        if expires is not None:
+            heapq.heappush(self._heap, (expires, effect.seq, effect))
+        return effect
+
+    def _live_due(self, round_number):
+        # A heap entry never expires before its parent, so everything due is
+        # in a subtree at the top; walk just that instead of the whole heap
+        heap = self._heap
+        due = []
+        stack = [0] if heap and heap[0][0] <= round_number else []
+        while stack:
+            i = stack.pop()
+            effect = heap[i][2]
+            if effect.active:
+                due.append(effect)
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap) and heap[child][0] <= round_number:
+                    stack.append(child)
+        return due
+
+    def due_ids(self, round_number):
+        """Ids whose buffs change if the round advances to round_number."""
+        due = self._live_due(round_number)
+        if not due:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate([e.ids for e in due]))
+
+    def advance(self, rounds=1):
+        """Move on rounds rounds and expire everything that has run out."""
+        self.round += rounds
+        expired = {}
+        while self._heap and self._heap[0][0] <= self.round:
+            _, _, effect = heapq.heappop(self._heap)
+            if effect.active:
+                effect.active = False
+                expired.setdefault(effect.name, set()).add(effect.seq)
+        # Each group that lost effects is recombined once
+        for name, seqs in expired.items():
+            self._set_group(name, [e for e in self._groups[name] if e.seq not in seqs])
+        return sum(len(seqs) for seqs in expired.values())
+
+    def clear(self):
+        for name in list(self._groups):
+            for effect in self._groups[name]:
+                effect.active = False
+            self._set_group(name, [])
+        self._heap = []
+
+    def state(self):
+        """Everything needed to put the scheduler back later, without touching the army."""
+        return (self.round, self._seq, tuple(
+            (e.name, e.damage_buff, e.expires, e.stacking, e.ids, e.seq) for e in self.active_effects()))
+
+    def set_state(self, state):
+        # The army's columns are restored separately, so buffs aren't reapplied
+        self.round, self._seq, effects = state
+        self._heap = []
+        self._groups = {}
+        for name, damage_buff, expires, stacking, ids, seq in effects:
+            effect = Effect(name, damage_buff, expires, stacking, ids, seq)
+            self._groups.setdefault(name, []).append(effect)
+            if expires is not None:
+                self._heap.append((expires, seq, effect))
+        heapq.heapify(self._heap)
+
+    def to_dict(self):
+        return {'round': self.round, 'seq': self._seq, 'effects': [e.to_dict() for e in self.active_effects()]}
+
+    def load_dict(self, data):
+        effects = [Effect.from_dict(e) for e in data['effects']]
+        self.set_state((data['round'], data['seq'],
+                        tuple((e.name, e.damage_buff, e.expires, e.stacking, e.ids, e.seq) for e in effects)))
+
+    def import_legacy_buffs(self):
+        """
+        Older armies only stored damage_buff and buff_duration per skeleton,
+        with the duration counted in attacks. Those become effects lasting
+        that many rounds, keeping the buff totals unchanged.
+        """
+        army = self.army
+        rows = army._alive_rows()
+        cols = army._columns
+        buffs = cols['damage_buff'][rows]
+        durations = cols['buff_duration'][rows]
+        for buff, duration in set(zip(buffs[buffs != 0].tolist(), durations[buffs != 0].tolist())):
+            ids = cols['id'][rows[(buffs == buff) & (durations == duration)]].copy()
+            self._seq += 1
+            expires = self.round + duration if duration > 0 else None
+            effect = Effect('buff', buff, expires, 'stack', ids, self._seq)
+            self._groups.setdefault('buff', []).append(effect)
+            if expires is not None:
+                heapq.heappush(self._heap, (expires, effect.seq, effect))
+        cols['buff_duration'][rows] = 0
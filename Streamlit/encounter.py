@@ -0,0 +1,175 @@
+"""
+Monte Carlo simulation of whole fights between a horde and some monsters.
+
+Every round the horde's surviving members attack the first monster still
+standing, using the same rules as group_attack. Then each surviving monster
+uses its save-forcing area attack (as group_saving_throw) on a random group
+of undead, and its weapon attacks on random single undead. A fight ends
+when one side is down or after max_rounds (a draw).
+
+Many fights are run at once as arrays, one row per fight, and with
+workers > 1 they are split across a process pool with independent random
+streams, so throughput grows with the number of cores.
+
+Buffs are held at their current values for the whole fight.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import numpy as np
+from classes import batch_attack_roll, batch_saving_throw
+
+# Upper bound on fights x undead simulated in one batch
+BATCH_CELLS = 2_000_000
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+@dataclass(frozen=True)
+class Monster:
+    name: str
+    max_health: int
+    armor_class: int
+    # Weapon attacks, each at one random undead
+    attacks: int = 0
+    to_hit: int = 0
+    damage: int = 0
+    damage_dice: tuple = (1, 6)
+    # Area attack forcing a saving throw, e.g. a breath weapon
+    save_targets: int = 0
+    save_dc: int = 0
+    save_damage: int = 0
+    save_ability: str = 'dexterity'
+    recharge: float = 1.0  # chance the area attack is ready on a given round
+
+def army_horde(army, skeleton_ids=None):
+    """(damage_buffs, current_health) of the army, or of skeleton_ids, for simulate_encounters."""
+    rows = army._alive_rows() if skeleton_ids is None else army._rows(skeleton_ids)
+    cols = army._columns
+    return cols['damage_buff'][rows].astype(np.int64), cols['current_health'][rows].astype(np.int64)
+
+def _pick_targets(rng, alive, count):
+    # Mask of count random living undead per fight (all of them if fewer are left)
+    if count >= alive.shape[1]:
+        return alive.copy()
+    keys = rng.random(alive.shape)
+    keys[~alive] = 2.0
+    chosen = np.argpartition(keys, count - 1, axis=1)[:, :count]
+    picked = np.zeros(alive.shape, dtype=bool)
+    np.put_along_axis(picked, chosen, True, axis=1)
+    return picked & alive
+
+def _fight(rng, damage_buffs, health, monsters, attack_type, profile, horde_armor_class, num_fights, max_rounds):
+    # Returns (outcome, rounds, losses) per fight; outcome is 1 win, -1 loss, 0 draw
+    num_undead = health.size
+    skel_hp = np.tile(health, (num_fights, 1))
+    mon_hp = np.tile(np.array([m.max_health for m in monsters], dtype=np.int64), (num_fights, 1))
+    mon_ac = np.array([m.armor_class for m in monsters], dtype=np.int64)
+
+    outcome = np.zeros(num_fights, dtype=np.int8)
+    rounds = np.full(num_fights, max_rounds, dtype=np.int64)
+    losses = np.zeros(num_fights, dtype=np.int64)
+    live = np.arange(num_fights)  # fights not decided yet
+
+    for round_number in range(1, max_rounds + 1):
+        fights = live.size
+        alive = skel_hp > 0
+        target = np.argmax(mon_hp > 0, axis=1)
+        hit, damage, _, _, _ = batch_attack_roll(np.broadcast_to(damage_buffs, skel_hp.shape),
+                                                 mon_ac[target][:, None], attack_type, rng=rng, profile=profile)
+        mon_hp[np.arange(fights), target] -= np.where(hit & alive, damage, 0).sum(axis=1)
+
+        for j, monster in enumerate(monsters):
+            acting = mon_hp[:, j] > 0
+            if monster.save_targets and monster.save_dc:
+                ready = acting & (rng.random(fights) < monster.recharge)
+                caught = _pick_targets(rng, skel_hp > 0, monster.save_targets) & ready[:, None]
+                _, save_damage, _, _, _ = batch_saving_throw(skel_hp.shape, monster.save_dc, monster.save_damage,
+                                                             monster.save_ability, rng=rng, profile=profile)
+                skel_hp -= np.where(caught, save_damage, 0)
+            dice_count, dice_sides = monster.damage_dice
+            for _ in range(monster.attacks):
+                struck = _pick_targets(rng, skel_hp > 0, 1) & acting[:, None]
+                rolls = rng.integers(1, 21, size=fights)
+                damage = monster.damage + rng.integers(1, dice_sides + 1, size=(fights, dice_count)).sum(axis=1)
+                critical = rolls == 20
+                damage[critical] *= 2
+                hits = critical | ((rolls != 1) & (rolls + monster.to_hit >= horde_armor_class))
+                skel_hp -= np.where(struck & hits[:, None], damage[:, None], 0)
+
+        won = (mon_hp <= 0).all(axis=1)
+        lost = ~(skel_hp > 0).any(axis=1)
+        done = won | lost
+        if done.any():
+            finished = live[done]
+            outcome[finished] = np.where(won[done], 1, -1)
+            rounds[finished] = round_number
+            losses[finished] = num_undead - (skel_hp[done] > 0).sum(axis=1)
+            # Only undecided fights are carried into the next round
+            keep = ~done
+            live, skel_hp, mon_hp = live[keep], skel_hp[keep], mon_hp[keep]
+        if not live.size:
+            break
+    losses[live] = num_undead - (skel_hp > 0).sum(axis=1)
+    return outcome, rounds, losses
+
+def _simulate_chunk(damage_buffs, health, monsters, attack_type, profile, horde_armor_class,
+                    num_fights, max_rounds, seed):
+    rng = np.random.default_rng(seed)
+    batch = max(1, BATCH_CELLS // max(health.size, 1))
+    parts = [_fight(rng, damage_buffs, health, monsters, attack_type, profile, horde_armor_class,
+                    min(batch, num_fights - start), max_rounds)
+             for start in range(0, num_fights, batch)]
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+def _distribution(values, size):
+    return {
+        'mean': float(values.mean()) if values.size else None,
+        'percentiles': dict(zip(PERCENTILES, np.percentile(values, PERCENTILES).tolist())) if values.size else None,
+        'distribution': np.bincount(values, minlength=size) / max(values.size, 1),
+    }
+
+def simulate_encounters(damage_buffs, health, monsters, attack_type='sword', profile=None,
+                        horde_armor_class=13, num_encounters=10_000, max_rounds=100, workers=None, seed=None):
+    """
+    Simulate num_encounters fights of the horde (one entry per undead in
+    damage_buffs and health, see army_horde) against monsters, a list of
+    Monster. profile is the horde's UndeadProfile, skeletons by default,
+    and seed an int or SeedSequence such as army.spawn_seeds(1)[0].
+
+    Returns the win, loss and draw probabilities, the distribution of the
+    number of rounds won fights took, and the distribution of how many
+    undead were lost per fight.
+    """
+    damage_buffs = np.asarray(damage_buffs, dtype=np.int64)
+    health = np.asarray(health, dtype=np.int64)
+    monsters = list(monsters)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(workers or 1)
+
+    if workers and workers > 1:
+        chunks = [len(part) for part in np.array_split(np.arange(num_encounters), workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_simulate_chunk,
+                                  [damage_buffs] * workers,
+                                  [health] * workers,
+                                  [monsters] * workers,
+                                  [attack_type] * workers,
+                                  [profile] * workers,
+                                  [horde_armor_class] * workers,
+                                  chunks,
+                                  [max_rounds] * workers,
+                                  seeds))
+        outcome, rounds, losses = (np.concatenate(arrays) for arrays in zip(*parts))
+    else:
+        outcome, rounds, losses = _simulate_chunk(damage_buffs, health, monsters, attack_type, profile,
+                                                  horde_armor_class, num_encounters, max_rounds, seeds[0])
+
+    wins = outcome == 1
+    return {
+        'num_encounters': num_encounters,
+        'win_probability': float(wins.mean()),
+        'loss_probability': float((outcome == -1).mean()),
+        'draw_probability': float((outcome == 0).mean()),
+        'rounds_to_win': _distribution(rounds[wins], max_rounds + 1),
+        'undead_lost': _distribution(losses, health.size + 1),
+    }
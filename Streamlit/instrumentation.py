@@ -0,0 +1,174 @@
+"""
+Lightweight timing spans, counters and histograms.
+
+Collection is off unless enable() is called or NECRO_METRICS=1 is set in the
+environment. While it is off span() hands back a shared no-op context
+manager and timed() functions make a single flag check before calling
+through, so instrumented code costs next to nothing.
+
+    with span('render.roster'):
+        ...
+
+    @timed('army.group_attack')
+    def group_attack(...):
+        ...
+
+Spans nest: a span opened inside another is recorded as 'outer/inner' as
+well as under its own name.
+"""
+import bisect
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds in seconds: 1us up to ~67s, doubling
+BUCKET_BOUNDS = [1e-6 * 2 ** i for i in range(27)]
+
+class _State:
+    enabled = os.environ.get('NECRO_METRICS', '') not in ('', '0')
+
+_state = _State()
+_lock = threading.Lock()
+_local = threading.local()
+_counters = {}
+_histograms = {}
+
+def enable():
+    _state.enabled = True
+
+def disable():
+    _state.enabled = False
+
+def is_enabled():
+    return _state.enabled
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+class Histogram:
+    """Fixed log-scale buckets, so memory use doesn't grow with observations."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and n:
+                bound = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_ms': self.total * 1000,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'min_ms': self.min * 1000 if self.count else 0.0,
+            'p50_ms': self.quantile(0.5) * 1000,
+            'p99_ms': self.quantile(0.99) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+def observe(name, seconds):
+    """Record a duration that was measured by hand."""
+    if not _state.enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+def count(name, value=1):
+    if not _state.enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+class _Span:
+    __slots__ = ('name', 'start', 'path')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.path = f"{stack[-1].path}/{self.name}" if stack else self.name
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        _local.stack.pop()
+        observe(self.name, elapsed)
+        if self.path != self.name:
+            observe(self.path, elapsed)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopSpan()
+
+def span(name):
+    """Context manager timing the code inside it under name."""
+    if not _state.enabled:
+        return _NOOP
+    return _Span(name)
+
+def timed(name):
+    """Decorator that runs the function inside span(name)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def snapshot():
+    """Current counters and histogram summaries."""
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'timings': {name: h.summary() for name, h in sorted(_histograms.items())},
+        }
+
+def export_jsonl(fileobj):
+    """Write one JSON line per counter and timing, stamped with the current time."""
+    data = snapshot()
+    timestamp = time.time()
+    for name, value in data['counters'].items():
+        fileobj.write(json.dumps({'time': timestamp, 'type': 'counter', 'name': name, 'value': value}) + '\n')
+    for name, summary in data['timings'].items():
+        fileobj.write(json.dumps({'time': timestamp, 'type': 'timing', 'name': name, **summary}) + '\n')
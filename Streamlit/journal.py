@@ -0,0 +1,113 @@
+from collections import deque
+
+class Journal:
+    """
+    Append-only undo/redo log for one SkeletonArmy.
+
+    Attach it with army.journal = Journal(army). Each mutating army method
+    then records a delta holding only the ids it touched and their values
+    before and after, plus the full rows of any skeletons it added or
+    removed. Undo and redo re-apply one delta, so their cost depends on the
+    size of that action and not on the size of the army. The army's random
+    stream and its effects are rewound too, so redoing a roll gives the same
+    result.
+
+    Every snapshot_every actions a copy of the army's columns is kept, so
+    seek() can jump far back without replaying every delta. At most
+    max_entries deltas are kept, so memory stays bounded: older ones are
+    dropped along with the snapshots that came before them.
+    """
+    def __init__(self, army, max_entries=200, snapshot_every=50):
+        self.army = army
+        self.max_entries = max_entries
+        self.snapshot_every = snapshot_every
+        self._entries = deque()
+        self._base = 0  # position of the oldest kept entry
+        self.position = 0  # number of actions applied, including dropped ones
+        self._snapshots = deque()
+        self._take_snapshot()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _take_snapshot(self):
+        columns = {name: col.copy() for name, col in self.army.export_columns().items()}
+        army = self.army
+        self._snapshots.append((self.position, columns, army.effects.state(), army.rng.bit_generator.state))
+
+    def record(self, change):
+        # A new action after some undos throws away the redo history
+        while self._base + len(self._entries) > self.position:
+            self._entries.pop()
+        while self._snapshots and self._snapshots[-1][0] > self.position:
+            self._snapshots.pop()
+
+        self._entries.append(change)
+        self.position += 1
+        if self.position % self.snapshot_every == 0:
+            self._take_snapshot()
+
+        # Drop the oldest entries, and the snapshots only they could reach
+        while len(self._entries) > self.max_entries:
+            self._entries.popleft()
+            self._base += 1
+        while self._snapshots and self._snapshots[0][0] < self._base:
+            self._snapshots.popleft()
+
+    def can_undo(self):
+        return self.position > self._base
+
+    def can_redo(self):
+        return self.position < self._base + len(self._entries)
+
+    def last_action(self):
+        if not self.can_undo():
+            return None
+        return self._entries[self.position - self._base - 1]['action']
+
+    def undo(self):
+        if not self.can_undo():
+            return False
+        change = self._entries[self.position - self._base - 1]
+        army = self.army
+        if change['removed'] is not None:
+            army._insert_rows(change['removed'])
+        army._write_values(change['ids'], change['before'])
+        if change['added'] is not None:
+            army._kill(army._rows(change['added']['id'].tolist()))
+        army.rng.bit_generator.state = change['rng_before']
+        army.effects.set_state(change['effects_before'])
+        self.position -= 1
+        return True
+
+    def redo(self):
+        if not self.can_redo():
+            return False
+        change = self._entries[self.position - self._base]
+        army = self.army
+        if change['added'] is not None:
+            army._insert_rows(change['added'])
+        army._write_values(change['ids'], change['after'])
+        if change['removed'] is not None:
+            army._kill(army._rows(change['removed']['id'].tolist()))
+        army.rng.bit_generator.state = change['rng_after']
+        army.effects.set_state(change['effects_after'])
+        self.position += 1
+        return True
+
+    def seek(self, position):
+        """Move to any position between the oldest kept action and the newest."""
+        position = max(self._base, min(position, self._base + len(self._entries)))
+        # Start from the closest snapshot if that beats stepping from here
+        usable = [snap for snap in self._snapshots if self._base <= snap[0] <= position]
+        if usable:
+            snap_position, columns, effects, rng_state = usable[-1]
+            if position - snap_position < abs(self.position - position):
+                self.army._load_columns(columns)
+                self.army.effects.set_state(effects)
+                self.army.rng.bit_generator.state = rng_state
+                self.position = snap_position
+        while self.position > position:
+            self.undo()
+        while self.position < position:
+            self.redo()
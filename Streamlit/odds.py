@@ -0,0 +1,82 @@
+"""
+Memoized odds of a single attack: the chance of a normal hit, of a
+critical hit, and its expected damage, per (profile, attack type, AC, buff).
+
+Every "what are my odds" question starts from these few numbers, so the
+Attack Odds panel, the damage sweep and distribution.py all read them from
+one shared OddsTable, and a repeated question is a dictionary lookup. The
+table is a bounded LRU, and a type's rows are dropped as soon as it is
+registered again with a new stat block.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from undead import get_profile, on_replace
+
+AttackOdds = namedtuple('AttackOdds', ['p_hit', 'p_crit', 'expected_damage'])
+
+def compute_odds(profile, attack_type, armor_class, damage_buff):
+    # Same rules as Skeleton.attack_roll: a natural 1 always misses, a natural
+    # 20 is always a critical hit, and a crit doubles all of the damage
+    bonus, damage, dice_count, dice_sides = profile.attack(attack_type)
+    p_hit = sum(1 for roll in range(2, 20) if roll + bonus >= armor_class) / 20
+    p_crit = 1 / 20
+    mean_hit = damage + damage_buff + dice_count * (dice_sides + 1) / 2
+    return AttackOdds(p_hit, p_crit, (p_hit + 2 * p_crit) * mean_hit)
+
+class OddsTable:
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._rows = OrderedDict()  # (profile, attack type, AC, buff) -> AttackOdds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def lookup(self, armor_class, attack_type='sword', damage_buff=0, profile=None):
+        profile = get_profile('Skeleton') if profile is None else profile
+        key = (profile, attack_type, int(armor_class), int(damage_buff))
+        with self._lock:
+            odds = self._rows.get(key)
+            if odds is not None:
+                self._rows.move_to_end(key)
+                self.hits += 1
+                return odds
+            self.misses += 1
+        odds = compute_odds(profile, attack_type, int(armor_class), int(damage_buff))
+        with self._lock:
+            self._rows[key] = odds
+            while len(self._rows) > self.maxsize:
+                self._rows.popitem(last=False)
+        return odds
+
+    def invalidate(self, profile):
+        """Forget every row computed for profile."""
+        with self._lock:
+            for key in [key for key in self._rows if key[0] is profile]:
+                del self._rows[key]
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'rows': len(self._rows), 'hits': self.hits, 'misses': self.misses}
+
+_table = None
+_table_lock = threading.Lock()
+
+def get_odds_table():
+    """The table shared by everything in this process."""
+    global _table
+    with _table_lock:
+        if _table is None:
+            _table = OddsTable()
+            on_replace(lambda old, new: _table.invalidate(old))
+        return _table
+
+def attack_odds(armor_class, attack_type='sword', damage_buff=0, profile=None):
+    """AttackOdds of one attack, from the shared table."""
+    return get_odds_table().lookup(armor_class, attack_type, damage_buff, profile)
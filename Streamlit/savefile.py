@@ -0,0 +1,228 @@
+"""
+Compact binary save format for an undead hoard.
+
+A save file is:
+    MAGIC | version (uint16) | flags (uint8) | metadata length (uint32) | metadata JSON
+followed by the packed column arrays of each army, in the order they are
+listed in the metadata, each army's followed by its statistics arrays. With FLAG_COMPRESSED set everything after the
+metadata is a single zlib stream. Since version 2 the metadata also holds
+each army's random seed and generator state, since version 3 its undead
+type and that type's stat block, since version 4 its active effects, and
+since version 5 its roll statistics (see stats.py). Old pickle saves can
+still be loaded through load_hoard, which only lets the pickle build our
+own classes.
+"""
+import io
+import json
+import pickle
+import struct
+import zlib
+import numpy as np
+from classes import COLUMNS, Skeleton, SkeletonArmy
+from undead import UNDEAD_TYPES, StatBlock, register_undead
+
+MAGIC = b'NECROARM'
+SAVE_VERSION = 5
+FLAG_COMPRESSED = 1
+FILE_EXTENSION = 'necro'
+
+_HEADER = struct.Struct('<HBI')
+_CHUNK_SIZE = 1 << 20
+
+class SaveFormatError(ValueError):
+    pass
+
+class _CompressedWriter:
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._compressor = zlib.compressobj(level=1)
+
+    def write(self, data):
+        self._fileobj.write(self._compressor.compress(data))
+
+    def close(self):
+        self._fileobj.write(self._compressor.flush())
+
+class _CompressedReader:
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._decompressor = zlib.decompressobj()
+        self._buffer = bytearray()
+
+    def read(self, size):
+        while len(self._buffer) < size:
+            chunk = self._fileobj.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            self._buffer += self._decompressor.decompress(chunk)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise SaveFormatError("Save file is truncated.")
+    return data
+
+def write_hoard(undead_hoard, fileobj, compress=True):
+    """Stream undead_hoard ({name: SkeletonArmy}) to a binary file object."""
+    armies = []
+    army_columns = []
+    for name, army in undead_hoard.items():
+        columns = army.export_columns()
+        stats_arrays = army.stats.arrays()
+        army_columns.append([*columns.values(), *stats_arrays.values()])
+        armies.append({
+            'name': name,
+            'max_health': int(army.max_health),
+            'attack_bonus': int(army.attack_bonus),
+            'dex_bonus': int(army.dex_bonus),
+            'count': len(army),
+            'rng': army.rng_state(),
+            'undead_type': army.undead_type,
+            'stat_block': army.profile.stat_block.to_dict(),
+            'effects': army.effects.to_dict(),
+            'stats': army.stats.to_dict(),
+            'fields': [{'name': field, 'dtype': col.dtype.str} for field, col in columns.items()],
+            'stats_fields': [{'name': field, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+                             for field, array in stats_arrays.items()],
+        })
+    metadata = json.dumps({'next_id': Skeleton._id_counter, 'armies': armies}).encode('utf-8')
+
+    fileobj.write(MAGIC)
+    fileobj.write(_HEADER.pack(SAVE_VERSION, FLAG_COMPRESSED if compress else 0, len(metadata)))
+    fileobj.write(metadata)
+
+    stream = _CompressedWriter(fileobj) if compress else fileobj
+    for arrays in army_columns:
+        for col in arrays:
+            # The arrays are contiguous, so this writes them without copying
+            stream.write(memoryview(np.ascontiguousarray(col).reshape(-1)).cast('B'))
+    if compress:
+        stream.close()
+
+def read_hoard(fileobj):
+    """Read a hoard written by write_hoard."""
+    try:
+        return _read_hoard(fileobj)
+    except SaveFormatError:
+        raise
+    except (ValueError, KeyError, TypeError, AttributeError, struct.error, zlib.error) as e:
+        # Bad JSON, missing or mistyped metadata fields, a broken zlib stream...
+        raise SaveFormatError(f"Save file is corrupt ({type(e).__name__}: {e}).") from e
+
+def _read_hoard(fileobj):
+    if fileobj.read(len(MAGIC)) != MAGIC:
+        raise SaveFormatError("Not an undead army save file.")
+    version, flags, metadata_length = _HEADER.unpack(_read_exact(fileobj, _HEADER.size))
+    if version > SAVE_VERSION:
+        raise SaveFormatError(f"Save file version {version} is newer than this app supports ({SAVE_VERSION}).")
+    metadata = json.loads(_read_exact(fileobj, metadata_length))
+
+    stream = _CompressedReader(fileobj) if flags & FLAG_COMPRESSED else fileobj
+    undead_hoard = {}
+    for army in metadata['armies']:
+        count = army['count']
+        columns = {}
+        for field in army['fields']:
+            dtype = np.dtype(field['dtype'])
+            data = np.frombuffer(_read_exact(stream, count * dtype.itemsize), dtype=dtype)
+            # Fields this version doesn't know about are skipped
+            if field['name'] in COLUMNS:
+                columns[field['name']] = data
+        stats_arrays = {}
+        for field in army.get('stats_fields', []):
+            dtype = np.dtype(field['dtype'])
+            shape = tuple(field['shape'])
+            data = _read_exact(stream, int(np.prod(shape)) * dtype.itemsize)
+            stats_arrays[field['name']] = np.frombuffer(data, dtype=dtype).reshape(shape)
+        # Types this app doesn't know yet (e.g. from another bestiary) come
+        # with their stat block; older files only hold skeletons
+        undead_type = army.get('undead_type', 'Skeleton')
+        if undead_type not in UNDEAD_TYPES:
+            register_undead(StatBlock.from_dict(army['stat_block']))
+        loaded = SkeletonArmy.from_columns(army['max_health'], army['attack_bonus'], army['dex_bonus'],
+                                           columns, undead_type=undead_type)
+        # Version 1 files have no random stream saved, those armies get a fresh one
+        if 'rng' in army:
+            loaded.set_rng_state(army['rng'])
+        # Before version 4 buffs were only the damage_buff and buff_duration columns
+        if 'effects' in army:
+            loaded.effects.load_dict(army['effects'])
+        else:
+            loaded.effects.import_legacy_buffs()
+        # Older files start with empty statistics
+        if 'stats' in army:
+            loaded.stats.load_dict(army['stats'], stats_arrays)
+        undead_hoard[army['name']] = loaded
+
+    # Keep newly raised skeletons from reusing the loaded ids
+    Skeleton._id_counter = max(Skeleton._id_counter, metadata['next_id'])
+    return undead_hoard
+
+class _LegacyUnpickler(pickle.Unpickler):
+    # Old saves are plain pickles; only allow the classes they actually contain
+    ALLOWED = {
+        ('classes', 'Skeleton'),
+        ('classes', 'SkeletonArmy'),
+        ('numpy', 'ndarray'),
+        ('numpy', 'dtype'),
+        ('numpy.core.multiarray', '_reconstruct'),
+        ('numpy._core.multiarray', '_reconstruct'),
+        ('numpy.core.multiarray', 'scalar'),
+        ('numpy._core.multiarray', 'scalar'),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self.ALLOWED:
+            raise SaveFormatError(f"Save file references {module}.{name}, which is not allowed.")
+        return super().find_class(module, name)
+
+class _Prefixed(io.RawIOBase):
+    # Puts back the bytes load_hoard read to sniff the file type
+    def __init__(self, prefix, fileobj):
+        self._prefix = prefix
+        self._fileobj = fileobj
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            n = min(len(buffer), len(self._prefix))
+            buffer[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        data = self._fileobj.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def load_hoard(fileobj):
+    """
+    Load a hoard from either the binary format or an old pickle save
+    (e.g. unead_army.pkl).
+    """
+    data = fileobj.read(len(MAGIC))
+    rest = io.BufferedReader(_Prefixed(data, fileobj))
+    if data == MAGIC:
+        return read_hoard(rest)
+    try:
+        undead_hoard = _LegacyUnpickler(rest).load()
+    except SaveFormatError:
+        raise
+    except (pickle.UnpicklingError, EOFError, ValueError, KeyError, TypeError, AttributeError, IndexError) as e:
+        raise SaveFormatError(f"Save file is corrupt ({type(e).__name__}: {e}).") from e
+    if not isinstance(undead_hoard, dict) or not all(
+            isinstance(name, str) and isinstance(army, SkeletonArmy) for name, army in undead_hoard.items()):
+        raise SaveFormatError("Save file doesn't hold an undead hoard.")
+    for army in undead_hoard.values():
+        if len(army):
+            next_id = int(army.export_columns()['id'].max()) + 1
+            Skeleton._id_counter = max(Skeleton._id_counter, next_id)
+    return undead_hoard
+
+def save_hoard_bytes(undead_hoard, compress=True):
+    buffer = io.BytesIO()
+    write_hoard(undead_hoard, buffer, compress)
+    return buffer.getvalue()
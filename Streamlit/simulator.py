@@ -0,0 +1,83 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from classes import batch_attack_roll
+
+# Upper bound on the number of attack rolls made in one vectorized batch
+BATCH_ROLLS = 1_000_000
+
+DAMAGE_PERCENTILES = (5, 25, 50, 75, 95)
+
+def army_damage_buffs(army, skeleton_ids=None):
+    """
+    Current damage buff of each attacking skeleton, in the form the simulator
+    expects. With no ids the whole army attacks.
+    """
+    if skeleton_ids is None:
+        rows = army._alive_rows()
+    else:
+        rows = army._rows(skeleton_ids)
+    return army._columns['damage_buff'][rows].astype(np.int64)
+
+def _simulate_rounds(damage_buffs, armor_class, attack_type, num_rounds, seed, profile=None):
+    # Runs num_rounds volleys and returns total damage and hit count per round
+    rng = np.random.default_rng(seed)
+    num_attackers = damage_buffs.size
+    batch = max(1, BATCH_ROLLS // max(num_attackers, 1))
+
+    total_damage = np.empty(num_rounds, dtype=np.int64)
+    num_hits = np.empty(num_rounds, dtype=np.int64)
+    for start in range(0, num_rounds, batch):
+        stop = min(start + batch, num_rounds)
+        buffs = np.broadcast_to(damage_buffs, (stop - start, num_attackers))
+        hit, damage, _, _, _ = batch_attack_roll(buffs, armor_class, attack_type, rng=rng, profile=profile)
+        total_damage[start:stop] = np.where(hit, damage, 0).sum(axis=1)
+        num_hits[start:stop] = hit.sum(axis=1)
+    return total_damage, num_hits
+
+def simulate_attacks(damage_buffs, armor_class, attack_type='sword', target_health=None,
+                     num_rounds=100_000, workers=None, seed=None, profile=None):
+    """
+    Monte Carlo estimate of one group_attack volley.
+
+    damage_buffs holds one entry per attacking skeleton (see army_damage_buffs).
+    Every round each attacker rolls once using the same rules as
+    Skeleton.attack_roll, with the stats of profile (an UndeadProfile,
+    skeletons by default). With workers > 1 the rounds are split across a
+    process pool, each worker getting an independent child stream of seed
+    (an int or a SeedSequence such as army.spawn_seeds(1)[0]).
+
+    Returns a dict with the mean damage, damage percentiles, the probability of
+    each number of hits and, if target_health is given, the probability that a
+    single volley deals at least that much damage.
+    """
+    damage_buffs = np.asarray(damage_buffs, dtype=np.int64)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(workers or 1)
+
+    if workers and workers > 1:
+        chunks = [len(part) for part in np.array_split(np.arange(num_rounds), workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_simulate_rounds,
+                                  [damage_buffs] * workers,
+                                  [armor_class] * workers,
+                                  [attack_type] * workers,
+                                  chunks,
+                                  seeds,
+                                  [profile] * workers))
+        total_damage = np.concatenate([p[0] for p in parts])
+        num_hits = np.concatenate([p[1] for p in parts])
+    else:
+        total_damage, num_hits = _simulate_rounds(damage_buffs, armor_class, attack_type, num_rounds, seeds[0], profile)
+
+    results = {
+        'num_rounds': num_rounds,
+        'mean_damage': float(total_damage.mean()),
+        'damage_percentiles': dict(zip(DAMAGE_PERCENTILES,
+                                       np.percentile(total_damage, DAMAGE_PERCENTILES).tolist())),
+        'hit_distribution': np.bincount(num_hits, minlength=damage_buffs.size + 1) / num_rounds,
+        'kill_probability': None,
+    }
+    if target_health is not None:
+        results['kill_probability'] = float((total_damage >= target_health).mean())
+    return results
@@ -0,0 +1,153 @@
+"""
+Running statistics of an army's rolls.
+
+Each army keeps an ArmyStats that group_attack and group_saving_throw
+update as they resolve, so totals, rates and d20 histograms are read
+straight off it instead of being recomputed from the roster on every
+rerun. Like the combat log it is a history of every roll made: undoing a
+roll doesn't take it back out of the stats. Saves (and so campaigns written
+out of memory) keep it: the totals via to_dict and the histograms, which
+grow with the army, as packed arrays.
+
+chi_square_fairness tests a d20 histogram against a fair die.
+"""
+import math
+import numpy as np
+
+ROLL_KINDS = ('attack', 'saving throw')
+
+_TOTALS = ('attacks', 'hits', 'critical_hits', 'critical_misses', 'damage_done',
+           'saving_throws', 'saves', 'critical_saves', 'critical_failures', 'damage_taken')
+
+class ArmyStats:
+    def __init__(self):
+        self.histograms = {kind: np.zeros(20, dtype=np.int64) for kind in ROLL_KINDS}
+        self.attacks = 0
+        self.hits = 0
+        self.critical_hits = 0
+        self.critical_misses = 0
+        self.damage_done = 0
+        self.saving_throws = 0
+        self.saves = 0
+        self.critical_saves = 0
+        self.critical_failures = 0
+        self.damage_taken = 0
+        self.damage_by_round = {}  # round -> damage dealt that round
+        # Per-skeleton histograms, one row per id ever rolled, ids sorted
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros((0, 20), dtype=np.int32)
+
+    def _id_rows(self, ids):
+        missing = np.setdiff1d(ids, self._ids)
+        if missing.size:
+            merged = np.union1d(self._ids, missing)
+            counts = np.zeros((merged.size, 20), dtype=np.int32)
+            counts[np.searchsorted(merged, self._ids)] = self._counts
+            self._ids, self._counts = merged, counts
+        return np.searchsorted(self._ids, ids)
+
+    def _record_rolls(self, kind, ids, rolls):
+        rolls = np.asarray(rolls, dtype=np.int64)
+        self.histograms[kind] += np.bincount(rolls - 1, minlength=20)
+        positions = self._id_rows(np.asarray(ids, dtype=np.int64))
+        # A skeleton rolls at most once per volley, so plain fancy indexing is enough
+        self._counts[positions, rolls - 1] += 1
+
+    def record_attack(self, result, round_number=0):
+        self._record_rolls('attack', result.ids, result.rolls)
+        damage = int(result.damage.sum())
+        self.attacks += result.ids.size
+        self.hits += int(result.hit.sum())
+        self.critical_hits += int(result.critical_hit.sum())
+        self.critical_misses += int(result.critical_miss.sum())
+        self.damage_done += damage
+        self.damage_by_round[round_number] = self.damage_by_round.get(round_number, 0) + damage
+
+    def record_saving_throw(self, result):
+        self._record_rolls('saving throw', result.ids, result.rolls)
+        self.saving_throws += result.ids.size
+        self.saves += int(result.success.sum())
+        self.critical_saves += int(result.critical_success.sum())
+        self.critical_failures += int(result.critical_failure.sum())
+        self.damage_taken += int(result.damage.sum())
+
+    def to_dict(self):
+        return {
+            **{name: getattr(self, name) for name in _TOTALS},
+            # JSON keys are strings, so rounds are kept as pairs
+            'damage_by_round': sorted(self.damage_by_round.items()),
+        }
+
+    def arrays(self):
+        """The histograms, for to_dict's caller to store alongside it."""
+        return {
+            'histograms': np.stack([self.histograms[kind] for kind in ROLL_KINDS]),
+            'skeleton_ids': self._ids,
+            'skeleton_counts': self._counts,
+        }
+
+    def load_dict(self, data, arrays=None):
+        for name in _TOTALS:
+            setattr(self, name, data[name])
+        self.damage_by_round = {round_number: damage for round_number, damage in data['damage_by_round']}
+        if arrays:
+            for kind, hist in zip(ROLL_KINDS, arrays['histograms']):
+                self.histograms[kind] = hist.astype(np.int64)
+            self._ids = arrays['skeleton_ids'].astype(np.int64)
+            self._counts = arrays['skeleton_counts'].astype(np.int32).reshape(self._ids.size, 20)
+
+    def histogram(self, kind=None):
+        """Count of each d20 face (index 0 is a 1) for kind, or all rolls."""
+        if kind is None:
+            return sum(self.histograms.values())
+        return self.histograms[kind].copy()
+
+    def skeleton_histogram(self, skel_id):
+        position = np.searchsorted(self._ids, skel_id)
+        if position < self._ids.size and self._ids[position] == skel_id:
+            return self._counts[position].astype(np.int64)
+        return np.zeros(20, dtype=np.int64)
+
+    def summary(self):
+        def rate(count, total):
+            return count / total if total else None
+        rounds = len(self.damage_by_round)
+        return {
+            'attacks': self.attacks,
+            'hit_rate': rate(self.hits, self.attacks),
+            'critical_hit_rate': rate(self.critical_hits, self.attacks),
+            'critical_miss_rate': rate(self.critical_misses, self.attacks),
+            'damage_done': self.damage_done,
+            'damage_per_round': self.damage_done / rounds if rounds else None,
+            'saving_throws': self.saving_throws,
+            'save_rate': rate(self.saves, self.saving_throws),
+            'critical_save_rate': rate(self.critical_saves, self.saving_throws),
+            'damage_taken': self.damage_taken,
+        }
+
+def _chi_square_survival(statistic, dof):
+    # P(X >= statistic) for X ~ chi-square(dof), in closed form for whole dof
+    half = statistic / 2
+    if half <= 0:
+        return 1.0
+    if dof % 2 == 0:
+        tail = sum(math.exp(-half + i * math.log(half) - math.lgamma(i + 1)) for i in range(dof // 2))
+    else:
+        tail = math.erfc(math.sqrt(half)) + sum(
+            math.exp(-half + (i - 0.5) * math.log(half) - math.lgamma(i + 0.5)) for i in range(1, (dof + 1) // 2))
+    return min(tail, 1.0)
+
+def chi_square_fairness(histogram):
+    """
+    Pearson's chi-square test of a d20 histogram against a fair die.
+    Returns (statistic, p_value); a small p-value (say below 0.01) means
+    rolls this lopsided would be rare from fair dice. Needs around 100
+    rolls (5 per face) to mean much, and returns (None, None) with none.
+    """
+    histogram = np.asarray(histogram, dtype=float)
+    total = histogram.sum()
+    if not total:
+        return None, None
+    expected = total / histogram.size
+    statistic = float(((histogram - expected) ** 2 / expected).sum())
+    return statistic, _chi_square_survival(statistic, histogram.size - 1)
@@ -0,0 +1,179 @@
+"""
+Sweeps of one group_attack volley's exact odds over a grid of target AC,
+damage buff, army size and attack type, for planning a session.
+
+Every skeleton in a cell has the same buff. Cells sharing an attack type,
+AC and buff form a line: its volley distributions for army sizes 1, 2, 3...
+are built by convolving in one more attack at a time, so a line costs about
+as much as its largest army. Lines are spread across a process pool and
+sweep() yields each line's cells as soon as it is done.
+
+Finished cells are kept in a SweepCache under a hash of everything they
+depend on: the attack's stats, AC, buff, army size and target HP. Widening
+the grid, or sweeping again after a rerun, only computes the new cells, and
+editing a stat block changes the hash so old cells are never reused. The
+cache also keeps each line's distribution at the largest army size done so
+far, so adding bigger armies carries on convolving from there.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from distribution import attack_pmf, probability_at_least
+from odds import attack_odds
+from undead import get_profile
+
+ARMOR_CLASSES = range(10, 26)
+DAMAGE_BUFFS = range(0, 11)
+ARMY_SIZES = range(1, 101)
+
+def cell_key(profile, attack_type, armor_class, damage_buff, army_size, target_health):
+    params = (profile.attack(attack_type), int(armor_class), int(damage_buff), int(army_size), int(target_health))
+    return hashlib.sha1(repr(params).encode('utf-8')).hexdigest()
+
+def line_key(profile, attack_type, armor_class, damage_buff):
+    params = (profile.attack(attack_type), int(armor_class), int(damage_buff))
+    return hashlib.sha1(repr(params).encode('utf-8')).hexdigest()
+
+class SweepCache:
+    """
+    Finished cells by cell_key, and each line's (army size, distribution)
+    by line_key, dropping the least recently used beyond max_cells and
+    max_lines.
+    """
+    def __init__(self, max_cells=1_000_000, max_lines=4096):
+        self.max_cells = max_cells
+        self.max_lines = max_lines
+        self._cells = OrderedDict()
+        self._lines = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cells)
+
+    def get(self, key):
+        with self._lock:
+            cell = self._cells.get(key)
+            if cell is None:
+                self.misses += 1
+            else:
+                self._cells.move_to_end(key)
+                self.hits += 1
+            return cell
+
+    def put(self, key, cell):
+        with self._lock:
+            self._cells[key] = cell
+            self._cells.move_to_end(key)
+            while len(self._cells) > self.max_cells:
+                self._cells.popitem(last=False)
+
+    def get_line(self, key):
+        with self._lock:
+            line = self._lines.get(key)
+            if line is not None:
+                self._lines.move_to_end(key)
+            return line
+
+    def put_line(self, key, army_size, pmf):
+        # Only the biggest army's distribution is worth keeping
+        with self._lock:
+            line = self._lines.get(key)
+            if line is None or line[0] < army_size:
+                self._lines[key] = (army_size, pmf)
+            self._lines.move_to_end(key)
+            while len(self._lines) > self.max_lines:
+                self._lines.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._lines.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'cells': len(self._cells), 'lines': len(self._lines), 'hits': self.hits, 'misses': self.misses}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_sweep_cache():
+    """The cache shared by every sweep in this process."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SweepCache()
+        return _cache
+
+def _sweep_line(profile, attack_type, armor_class, damage_buff, army_sizes, target_health, start=None):
+    # (army size, mean damage, kill probability) for each size on one line,
+    # and the line's (largest size, distribution). start is an earlier
+    # (size, distribution) to carry on from when every size wanted is bigger
+    pmf = attack_pmf(armor_class, attack_type, damage_buff, profile)
+    mean = attack_odds(armor_class, attack_type, damage_buff, profile).expected_damage
+    wanted = set(army_sizes)
+    done, total = (0, np.ones(1)) if start is None or start[0] >= min(wanted) else start
+    results = []
+    for size in range(done + 1, max(wanted) + 1):
+        total = np.convolve(total, pmf)
+        if size in wanted:
+            results.append((size, size * mean, probability_at_least(total, target_health)))
+    return results, (max(done, max(wanted)), total)
+
+def sweep(profile=None, armor_classes=ARMOR_CLASSES, damage_buffs=DAMAGE_BUFFS, army_sizes=ARMY_SIZES,
+          attack_types=None, target_health=100, workers=None, cache=None):
+    """
+    Yield lists of finished cells, cached ones first and then one list per
+    line as it completes. Each cell is a dict of attack_type, armor_class,
+    damage_buff, army_size, mean_damage and kill_probability (of dealing
+    target_health or more in one volley). attack_types defaults to all of
+    profile's (skeletons by default).
+    """
+    profile = get_profile('Skeleton') if profile is None else profile
+    attack_types = profile.attack_types if attack_types is None else attack_types
+    cache = get_sweep_cache() if cache is None else cache
+    army_sizes = [int(size) for size in army_sizes]
+
+    cached = []
+    lines = []
+    for attack_type in attack_types:
+        for armor_class in armor_classes:
+            for damage_buff in damage_buffs:
+                line = (attack_type, int(armor_class), int(damage_buff))
+                missing = []
+                for size in army_sizes:
+                    cell = cache.get(cell_key(profile, *line, size, target_health))
+                    if cell is None:
+                        missing.append(size)
+                    else:
+                        cached.append(cell)
+                if missing:
+                    lines.append((line, missing))
+    if cached:
+        yield cached
+
+    def finish(line, computed):
+        results, (army_size, pmf) = computed
+        cache.put_line(line_key(profile, *line), army_size, pmf)
+        cells = []
+        for size, mean_damage, kill_probability in results:
+            cell = {'attack_type': line[0], 'armor_class': line[1], 'damage_buff': line[2], 'army_size': size,
+                    'mean_damage': mean_damage, 'kill_probability': kill_probability}
+            cache.put(cell_key(profile, *line, size, target_health), cell)
+            cells.append(cell)
+        return cells
+
+    if workers and workers > 1 and len(lines) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_sweep_line, profile, *line, missing, target_health,
+                                   cache.get_line(line_key(profile, *line))): line
+                       for line, missing in lines}
+            for future in as_completed(futures):
+                yield finish(futures[future], future.result())
+    else:
+        for line, missing in lines:
+            yield finish(line, _sweep_line(profile, *line, missing, target_health,
+                                           cache.get_line(line_key(profile, *line))))
@@ -0,0 +1,149 @@
+"""
+Registry of undead stat blocks.
+
+Each type of undead is described by a StatBlock: its hit points, the
+attacks it can make and its saving throw bonuses. register_undead compiles
+a block once into an UndeadProfile, the flat lookup form the batch rolls in
+classes.py read, so a new type needs no new code:
+
+    register_undead(StatBlock('Ghast', max_health=36,
+                              attacks={'claws': Attack(to_hit=5, damage=3, dice=(2, 6))},
+                              saves={'constitution': 0}))
+"""
+from dataclasses import asdict, dataclass, field
+
+ABILITIES = ('strength', 'dexterity', 'constitution', 'intelligence', 'wisdom', 'charisma')
+
+DAMAGE_TYPES = ('acid', 'bludgeoning', 'cold', 'fire', 'force', 'lightning', 'necrotic',
+                'piercing', 'poison', 'psychic', 'radiant', 'slashing', 'thunder')
+DAMAGE_MODIFIERS = ('normal', 'resistant', 'vulnerable', 'immune')
+
+@dataclass(frozen=True)
+class Attack:
+    to_hit: int
+    damage: int  # flat damage added to the dice roll
+    dice: tuple = (1, 6)  # (count, sides)
+
+@dataclass
+class StatBlock:
+    name: str
+    max_health: int
+    attacks: dict  # attack name -> Attack
+    saves: dict = field(default_factory=dict)  # ability -> saving throw bonus
+    attack_bonus: int = 0
+    dex_bonus: int = 0
+    challenge_rating: float = 0
+    damage_modifiers: dict = field(default_factory=dict)  # damage type -> one of DAMAGE_MODIFIERS
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data['attacks'] = {name: Attack(a['to_hit'], a['damage'], tuple(a['dice']))
+                           for name, a in data['attacks'].items()}
+        return cls(**data)
+
+@dataclass(frozen=True, eq=False)
+class UndeadProfile:
+    """
+    A StatBlock compiled for rolling. attack_table maps each attack name to
+    (to_hit, flat damage, dice count, dice sides) and save_bonus holds a
+    bonus for every ability, so a roll only does dictionary lookups.
+
+    Profiles compare and hash by identity, so caches keyed on one are
+    dropped naturally when a type is registered again with new stats.
+    """
+    name: str
+    max_health: int
+    attack_bonus: int
+    dex_bonus: int
+    attack_types: tuple
+    attack_table: dict
+    save_bonus: dict
+    stat_block: StatBlock
+
+    def attack(self, attack_type):
+        try:
+            return self.attack_table[attack_type]
+        except KeyError:
+            raise ValueError(f"Unknown attack type: {attack_type}") from None
+
+    def saving_bonus(self, ability_type):
+        return self.save_bonus.get(ability_type.lower(), 0)
+
+    def damage_modifier(self, damage_type):
+        if damage_type is None:
+            return 'normal'
+        return self.stat_block.damage_modifiers.get(damage_type.lower(), 'normal')
+
+def compile_stat_block(stat_block):
+    attack_table = {}
+    for name, attack in stat_block.attacks.items():
+        count, sides = attack.dice
+        attack_table[name] = (attack.to_hit, attack.damage, count, sides)
+    save_bonus = {ability: 0 for ability in ABILITIES}
+    save_bonus.update({ability.lower(): bonus for ability, bonus in stat_block.saves.items()})
+    return UndeadProfile(stat_block.name, stat_block.max_health, stat_block.attack_bonus,
+                         stat_block.dex_bonus, tuple(attack_table), attack_table, save_bonus,
+                         stat_block)
+
+UNDEAD_TYPES = {}
+
+# Called with (old profile, new profile) when a type is registered again
+_replace_hooks = []
+
+def on_replace(hook):
+    _replace_hooks.append(hook)
+    return hook
+
+def register_undead(stat_block):
+    """Compile stat_block and make it available by name, replacing any old one."""
+    profile = compile_stat_block(stat_block)
+    old = UNDEAD_TYPES.get(stat_block.name)
+    UNDEAD_TYPES[stat_block.name] = profile
+    if old is not None:
+        for hook in _replace_hooks:
+            hook(old, profile)
+    return profile
+
+def get_profile(undead_type):
+    try:
+        return UNDEAD_TYPES[undead_type]
+    except KeyError:
+        raise ValueError(f"Unknown undead type: {undead_type}") from None
+
+# The skeletons the app was built around, with the necromancer's buffs
+# already folded into their attacks
+register_undead(StatBlock(
+    'Skeleton', max_health=47,
+    attacks={'sword': Attack(to_hit=15, damage=11), 'bow': Attack(to_hit=13, damage=5)},
+    saves={'strength': 2, 'dexterity': 2, 'constitution': 2, 'intelligence': 2, 'wisdom': -1, 'charisma': -3},
+    attack_bonus=13, dex_bonus=2, challenge_rating=0.25,
+    damage_modifiers={'bludgeoning': 'vulnerable', 'poison': 'immune'},
+))
+register_undead(StatBlock(
+    'Zombie', max_health=22,
+    attacks={'slam': Attack(to_hit=3, damage=1)},
+    saves={'strength': 1, 'dexterity': -2, 'constitution': 3, 'intelligence': -4, 'wisdom': 0, 'charisma': -3},
+    attack_bonus=3, dex_bonus=-2, challenge_rating=0.25,
+    damage_modifiers={'poison': 'immune'},
+))
+register_undead(StatBlock(
+    'Ghoul', max_health=22,
+    attacks={'claws': Attack(to_hit=4, damage=2, dice=(2, 4)), 'bite': Attack(to_hit=2, damage=2, dice=(2, 6))},
+    saves={'strength': 1, 'dexterity': 2, 'constitution': 0, 'intelligence': -2, 'wisdom': 0, 'charisma': -2},
+    attack_bonus=4, dex_bonus=2, challenge_rating=1,
+    damage_modifiers={'poison': 'immune'},
+))
+register_undead(StatBlock(
+    'Wight', max_health=45,
+    attacks={'longsword': Attack(to_hit=4, damage=2, dice=(1, 8)), 'longbow': Attack(to_hit=4, damage=2, dice=(1, 8))},
+    saves={'strength': 2, 'dexterity': 1, 'constitution': 3, 'intelligence': 0, 'wisdom': 1, 'charisma': 2},
+    attack_bonus=4, dex_bonus=1, challenge_rating=3,
+    damage_modifiers={'necrotic': 'resistant', 'poison': 'immune'},
+))
+
+# Types that ship with the app; bestiary rows never replace these
+BUILTIN_TYPES = frozenset(UNDEAD_TYPES)
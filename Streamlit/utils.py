@@ -0,0 +1,21 @@
+def parse_skeleton_ids(input_str):
+    """
+    Parses a string input to extract skeleton IDs.
+    Supports ranges indicated by a hyphen and lists separated by commas.
+    """
+    skeleton_ids = []
+    parts = input_str.split(',')
+    for part in parts:
+        if '-' in part:
+            start, end = map(int, part.split('-'))
+            skeleton_ids.extend(range(start, end + 1))
+        else:
+            skeleton_ids.append(int(part))
+    return skeleton_ids
+
+def parse_amounts(input_str):
+    """
+    Parses damage or healing amounts separated by commas, spaces or new
+    lines, e.g. a column pasted from a spreadsheet.
+    """
+    return [int(part) for part in input_str.replace(',', ' ').split()]